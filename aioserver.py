@@ -0,0 +1,205 @@
+from typing import Tuple, Dict, Any, Callable, Optional
+
+import os
+import sys
+import socket
+import asyncio
+
+from rules import BOARD_WIDTH, BOARD_HEIGHT
+from ratings import RATINGS_PATH
+from core import Player, GameServer
+from wire import TERMINATOR, encode_message, decode
+from metrics import METRICS_ENV, MAX_REQUEST_LINE, http_response, request_path, endpoint_address
+from cluster import ClusterNode, UnixBroker
+
+
+class AsyncChannel(Player, asyncio.Protocol):
+    """Connection of one client, speaking the PodSixNet protocol over asyncio"""
+
+    def __init__(self, server: 'AsyncServer') -> None:
+        self._server = server
+        self._ibuffer = b""
+        self.transport = None
+        self.addr = ()
+        self._outbox = [] # Messages of the current tick, written by Flush()
+        self.init_player()
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        self.addr = transport.get_extra_info("peername")
+        self.Send({"action": "connected"})
+        self._server.Connected(self, self.addr)
+
+    def data_received(self, data: bytes) -> None:
+        self._ibuffer += data
+        *messages, self._ibuffer = self._ibuffer.split(TERMINATOR)
+        for message in messages:
+            self.found_message(decode(message))
+
+    def found_message(self, data: Any) -> None:
+        """Dispatch a message to its Network_* handler, like PodSixNet channels"""
+        if isinstance(data, dict) and "action" in data:
+            self.Dispatch(data)
+        else:
+            print("OOB data:", data)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.Close()
+
+    def Send(self, data: Dict[str, Any]) -> int:
+        """Returns the number of bytes sent after encoding."""
+        return self.SendEncoded(encode_message(data), data["action"])
+
+    def SendEncoded(self, payload: bytes, action: str) -> int:
+        """Queue a message already encoded with encode_message(), written at the end of the tick"""
+        if self._server.metrics is not None:
+            self._server.metrics.sent(action, len(payload))
+        if not self._outbox:
+            asyncio.get_running_loop().call_soon(self.Flush)
+        self._outbox.append(payload)
+        return len(payload)
+
+    def QueuedBytes(self) -> int:
+        """Bytes queued for this client and not accepted by its socket yet"""
+        return self.transport.get_write_buffer_size() + sum(len(payload) for payload in self._outbox)
+
+    def Disconnect(self) -> None:
+        """Drop the connection of a client that does not keep up"""
+        self._outbox = []
+        self.transport.abort() # connection_lost() follows
+
+    def Flush(self) -> None:
+        """Write the messages queued since the last flush as one buffer"""
+        count = len(self._outbox)
+        if not count:
+            return # Dropped by Disconnect()
+        if not self.transport.is_closing():
+            self.transport.write(b"".join(self._outbox))
+        self._outbox = []
+        if self._server.metrics is not None:
+            self._server.metrics.write_sizes.observe(count)
+
+
+class MetricsProtocol(asyncio.Protocol):
+    """One request to the metrics endpoint, see GameServer.AdminRequest()"""
+
+    def __init__(self, server: GameServer) -> None:
+        self.server = server
+        self.transport = None
+        self._ibuffer = b""
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self._ibuffer = (self._ibuffer + data)[:MAX_REQUEST_LINE]
+        if b"\r\n\r\n" in self._ibuffer or len(self._ibuffer) == MAX_REQUEST_LINE:
+            self.transport.write(http_response(self.server.AdminRequest(request_path(self._ibuffer))))
+            self.transport.close()
+
+
+class AsyncServer(GameServer):
+    """Game server running on an asyncio event loop instead of PodSixNet"""
+
+    def __init__(self, mylocaladdr: Tuple[str, int],
+                 board_size: Tuple[int, int] = (BOARD_WIDTH, BOARD_HEIGHT),
+                 shards: int = 0, broker_path: Optional[str] = None,
+                 ratings: Optional[str] = RATINGS_PATH, metrics_address: Optional[str] = None) -> None:
+        self.localaddr = mylocaladdr
+        self.broker_path = broker_path
+        self.metrics_address = metrics_address
+        self.init_server(board_size, shards, ratings)
+
+    def CallLater(self, delay: float, callback: Callable[[], None]) -> None:
+        """Run a callback from the event loop after `delay` seconds"""
+        if self.profiler is not None:
+            callback = self.profiler.deferred(callback)
+        asyncio.get_running_loop().call_later(delay, callback)
+
+    def ReceiveShard(self, connection: Any) -> None:
+        """Handle the replies of a worker, and stop watching its pipe once broken"""
+        if not self.shards.receive(connection):
+            asyncio.get_running_loop().remove_reader(connection.fileno())
+
+    def JoinCluster(self, broker_path: str) -> None:
+        """Share the lobby with the other nodes connected to a cluster broker"""
+        loop = asyncio.get_running_loop()
+        broker = UnixBroker(broker_path)
+        fileno = broker.fileno()
+        def gone() -> None:
+            loop.remove_reader(fileno)
+            loop.remove_writer(fileno)
+        def receive() -> None:
+            if not node.receive():
+                gone()
+        def write() -> None:
+            # Tried at the end of the tick, then each time the socket is writable until all is written
+            if not node.write():
+                gone()
+            elif broker.pending():
+                loop.add_writer(fileno, write)
+            else:
+                loop.remove_writer(fileno)
+        broker.on_pending = lambda: loop.call_soon(write)
+        node = ClusterNode(self, broker)
+        loop.add_reader(fileno, receive)
+        print(f"Cluster node {node.node}")
+
+    async def ServeMetrics(self, address: str) -> None:
+        """Keep metrics, and serve them in the Prometheus text format over
+        HTTP at "host:port" or at the path of a Unix socket"""
+        self.EnableMetrics()
+        family, addr = endpoint_address(address)
+        loop = asyncio.get_running_loop()
+        if family == socket.AF_UNIX:
+            await loop.create_unix_server(lambda: MetricsProtocol(self), addr)
+        else:
+            await loop.create_server(lambda: MetricsProtocol(self), *addr, reuse_address=True)
+        print(f"Metrics served at {address}")
+    
+    async def Serve(self) -> None:
+        """Accept connections until cancelled"""
+        host, port = self.localaddr
+        loop = asyncio.get_running_loop()
+        if self.shards:
+            for connection in self.shards.connections:
+                loop.add_reader(connection.fileno(), self.ReceiveShard, connection)
+        if self.broker_path:
+            self.JoinCluster(self.broker_path)
+        self.LoadLeaderboard()
+        if self.metrics_address:
+            await self.ServeMetrics(self.metrics_address)
+        server = await loop.create_server(
+            lambda: AsyncChannel(self), host, port, reuse_address=True
+            )
+        print('Server launched')
+        async with server:
+            await server.serve_forever()
+
+    def Launch(self) -> None:
+        asyncio.run(self.Serve())
+
+
+if __name__ == '__main__':
+    board_size = (BOARD_WIDTH, BOARD_HEIGHT)
+    shards = 0
+    broker_path = None
+    if len(sys.argv) not in (2, 3, 4, 5):
+        print("Please use: python3", sys.argv[0], "host:port [columnsxrows [workers [broker_socket]]]")
+        print("e.g., python3", sys.argv[0], "localhost:31425 15x11 4 /tmp/sausage.sock")
+        host, port = "localhost", "31425"
+    else:
+        host, port = sys.argv[1].split(":")
+        if len(sys.argv) >= 3:
+            board_size = tuple(int(n) for n in sys.argv[2].split("x"))
+        if len(sys.argv) >= 4:
+            shards = int(sys.argv[3])
+        if len(sys.argv) == 5:
+            broker_path = sys.argv[4]
+    s = AsyncServer((host, int(port)), board_size, shards, broker_path,
+                    metrics_address=os.environ.get(METRICS_ENV))
+    s.ProfileOnSignal()
+    try:
+        s.Launch()
+    except KeyboardInterrupt:
+        pass
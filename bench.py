@@ -0,0 +1,317 @@
+from typing import List, Dict, Optional, Any, Callable
+
+import gc
+import io
+import os
+import sys
+import json
+import random
+import platform
+from time import perf_counter
+from multiprocessing.connection import wait
+from contextlib import redirect_stdout
+
+from rules import get_table
+from core import Player, GameServer
+
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures.json")
+RESULTS_PATH = "bench_results.json"
+THRESHOLD = 0.25 # Slowdown over the baseline that counts as a regression
+REPEAT = 5 # Runs of each case, the fastest one is kept
+MIN_TIME = 0.1 # Seconds a run lasts at least, calls are repeated until then
+LOBBY_SIZES = (10, 100, 1000, 10000)
+BOARDS = ((9, 7), (21, 15))
+CANDIDATES = 200 # Sausages checked against each recorded position
+GAMES = 100 # Games ended by each run of the EndGame cases, played by each run of the Moves cases
+WORKERS = (0, 2) # Worker processes of the Moves cases, 0 to play the games in the server
+MOVES_POSITION = "late-21x15" # Recorded position whose moves are replayed by the Moves cases
+SEED = 20250101
+
+
+class BenchPlayer(Player):
+    """Player without a connection, its messages are dropped"""
+
+    def __init__(self, server: GameServer) -> None:
+        self.init_player()
+        self._server = server
+
+    def Send(self, data: Dict[str, Any]) -> int:
+        return 0
+
+    def SendEncoded(self, payload: bytes, action: str) -> int:
+        return len(payload)
+
+    def QueuedBytes(self) -> int:
+        return 0
+
+    def Disconnect(self) -> None:
+        pass
+
+
+class BenchServer(GameServer):
+    """Game server without a transport nor a rating store"""
+
+    def __init__(self, shards: int = 0) -> None:
+        self.init_server(shards=shards, ratings=None)
+
+    def lobby(self, size: int, seed: int = SEED) -> List[BenchPlayer]:
+        """Connect `size` players with reproducible nicknames and ELOs, all
+    receiving the full lobby"""
+        rng = random.Random(seed)
+        players = []
+        with redirect_stdout(io.StringIO()): # AddPlayer() prints every connection
+            for n in range(size):
+                player = BenchPlayer(self)
+                self.AddPlayer(player)
+                player.lobby_mode = "full" # As SubscribeLobby() does, without the snapshot nobody reads
+                self.players.rename(player, f"player{n}")
+                player.elo = int(rng.gauss(1000, 200))
+                self.UpdateLobby(player)
+                players.append(player)
+        self.RunTimers()
+        return players
+
+
+def record_fixtures(seed: int = SEED) -> Dict[str, Any]:
+    """Play a random game on each board and keep its position halfway and
+    just before the end, with sausages to check against them"""
+    rng = random.Random(seed)
+    positions = {}
+    for columns, rows in BOARDS:
+        table = get_table(columns, rows)
+        remaining = table.full_mask
+        moves = []
+        while remaining:
+            sausage_id = rng.choice([i for i in range(remaining.bit_length()) if remaining >> i & 1])
+            moves.append(sausage_id)
+            remaining = table.play(remaining, sausage_id)
+        positions[f"mid-{columns}x{rows}"] = moves[:len(moves) // 2]
+        positions[f"late-{columns}x{rows}"] = moves[:-1] # One move before the end
+    fixtures = {"seed": seed, "positions": {}}
+    for name, moves in positions.items():
+        columns, rows = (int(n) for n in name.split("-")[1].split("x"))
+        table = get_table(columns, rows)
+        fixtures["positions"][name] = {
+            "columns": columns,
+            "rows": rows,
+            "moves": [table.sausages[i] for i in moves],
+            # Half of them legal sausages, half any three points of the board
+            "candidates": [table.sausages[i] for i in rng.sample(range(len(table)), min(len(table), CANDIDATES // 2))]
+                          + [rng.sample(table.nodes, 3) for _ in range(CANDIDATES // 2)]
+            }
+    return fixtures
+
+
+def load_fixtures() -> Dict[str, Any]:
+    with open(FIXTURES_PATH) as f:
+        return json.load(f)
+
+
+def timeit(case: Callable[[], Any], calls: int = 1, setup: Optional[Callable[[], Any]] = None) -> float:
+    """Seconds per call of the fastest of REPEAT runs.
+
+    Args:
+        case: Function to time, making `calls` calls of the measured code
+        setup: Run before each call of `case`, out of the measure
+    """
+    best = float("inf")
+    collecting = gc.isenabled()
+    gc.disable() # As timeit does, a collection would land on a random case
+    try:
+        for _ in range(REPEAT):
+            elapsed, done = 0.0, 0
+            while elapsed < MIN_TIME:
+                if setup is not None:
+                    setup()
+                start = perf_counter()
+                case()
+                elapsed += perf_counter() - start
+                done += calls
+            best = min(best, elapsed / done)
+    finally:
+        if collecting:
+            gc.enable()
+    return best
+
+
+def bench_positions(fixtures: Dict[str, Any]) -> Dict[str, float]:
+    """ValidateSausage, CheckCrossing and check_end_game on the recorded positions"""
+    results = {}
+    for name, position in sorted(fixtures["positions"].items()):
+        server = BenchServer()
+        player1, player2 = server.lobby(2)
+        game_id = server.CreateGame(player1, player2, position["columns"], position["rows"])
+        game = server.games[game_id]
+        for points in position["moves"]:
+            game.play(game.table.sausage_id(points))
+        candidates = [[tuple(p) for p in sausage] for sausage in position["candidates"]]
+        placed = [[tuple(p) for p in sausage] for sausage in position["moves"]]
+        pairs = [(candidate, sausage) for candidate in candidates[:20] for sausage in placed]
+
+        def validate():
+            for points in candidates:
+                server.ValidateSausage(points, game_id)
+        results[f"ValidateSausage/{name}"] = timeit(validate, len(candidates))
+
+        def cross():
+            for sausage1, sausage2 in pairs:
+                server.CheckCrossing(sausage1, sausage2)
+        results[f"CheckCrossing/{name}"] = timeit(cross, len(pairs))
+
+        results[f"check_end_game/{name}"] = timeit(lambda: server.check_end_game(game_id, player1))
+    return results
+
+
+def bench_lobbies() -> Dict[str, float]:
+    """UpdateLobby, FindPlayer and EndGame (with its lobby flush) with lobbies of LOBBY_SIZES players"""
+    results = {}
+    for size in LOBBY_SIZES:
+        for mode in ("full", "window"):
+            server = BenchServer()
+            players = server.lobby(size)
+            if mode == "window":
+                for player in players:
+                    server.SubscribeLobby(player, "window")
+            player = players[size // 2]
+            step = [1]
+
+            def update():
+                # An ELO change, sent to the lobby at the end of the tick
+                step[0] = -step[0]
+                player.elo += step[0]
+                server.UpdateLobby(player)
+                server.RunTimers()
+            results[f"UpdateLobby/{mode}-{size}"] = timeit(update)
+
+        server = BenchServer()
+        players = server.lobby(size)
+        nicknames = [player.nickname for player in random.Random(SEED).sample(players, min(size, 100))]
+        nicknames.append("nobody")
+
+        def find():
+            for nickname in nicknames:
+                server.FindPlayer(nickname)
+        results[f"FindPlayer/{size}"] = timeit(find, len(nicknames))
+
+        pairs = [(players[i], players[i + 1]) for i in range(0, min(size, 2 * GAMES), 2)]
+
+        elos = [(player1.elo, player2.elo) for player1, player2 in pairs]
+
+        def start_games():
+            server.RunTimers()
+            for (player1, player2), (elo1, elo2) in zip(pairs, elos):
+                player1.elo, player2.elo = elo1, elo2 # Or the winners climb forever
+                player1._start_game_with(player2)
+            server.RunTimers()
+
+        def end_games():
+            # The results, and the lobby flush sending them at the end of the tick
+            for player1, player2 in pairs:
+                server.EndGame(player1.game_id, player1.nickname)
+            server.RunTimers()
+        results[f"EndGame/{size}"] = timeit(end_games, len(pairs), setup=start_games)
+    return results
+
+
+def bench_moves(fixtures: Dict[str, Any]) -> Dict[str, float]:
+    """Moves received by the server, until both players are told, with the
+    games played in the server or by WORKERS processes"""
+    results = {}
+    position = fixtures["positions"][MOVES_POSITION]
+    moves = [[tuple(p) for p in sausage] for sausage in position["moves"]]
+    for workers in WORKERS:
+        server = BenchServer(workers)
+        players = server.lobby(2 * GAMES)
+        pairs = [(players[i], players[i + 1]) for i in range(0, len(players), 2)]
+        replies = [0]
+        if server.shards is not None:
+            def on_result(message, handle=server.ShardResult):
+                replies[0] += 1
+                handle(message)
+            server.shards.on_result = on_result
+
+        def start_games():
+            for player1, player2 in pairs:
+                if player1.game_id is not None:
+                    server.CloseGame(server.games[player1.game_id])
+                player1._start_game_with(player2, (position["columns"], position["rows"]))
+            server.RunTimers()
+
+        def play():
+            replies[0] = 0
+            for n, points in enumerate(moves):
+                for pair in pairs:
+                    pair[n % 2].Network_ovals({"ovals": points})
+                if server.shards is not None:
+                    # As the transports do between two reads, or the pipes fill up both ways
+                    for connection in wait(server.shards.connections, 0):
+                        server.shards.receive(connection)
+            if server.shards is not None:
+                # Done once the workers replied to every move
+                while replies[0] < len(moves) * len(pairs):
+                    for connection in wait(server.shards.connections):
+                        server.shards.receive(connection)
+        results[f"Moves/{workers}-workers"] = timeit(play, len(moves) * len(pairs), setup=start_games)
+        if server.shards is not None:
+            server.shards.close()
+    return results
+
+
+def run() -> Dict[str, Any]:
+    results = {}
+    fixtures = load_fixtures()
+    results.update(bench_positions(fixtures))
+    results.update(bench_lobbies())
+    results.update(bench_moves(fixtures))
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+        }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = THRESHOLD) -> List[str]:
+    """Print the results next to a baseline, and return the cases slower
+    than the baseline by more than `threshold`"""
+    regressions = []
+    for case, seconds in results["results"].items():
+        before = baseline["results"].get(case)
+        if before is None:
+            print(f"{case:32} {seconds * 1e6:12.2f} us   (new)")
+            continue
+        ratio = seconds / before
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(case)
+        print(f"{case:32} {seconds * 1e6:12.2f} us   {before * 1e6:12.2f} us   x{ratio:.2f}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2 and sys.argv[1] == "record":
+        with open(FIXTURES_PATH, "w") as f:
+            json.dump(record_fixtures(), f)
+        print("Fixtures recorded in", FIXTURES_PATH)
+        sys.exit(0)
+    if len(sys.argv) > 4:
+        print("Please use: python3", sys.argv[0], "[results.json [baseline.json [threshold]]]")
+        print("       or: python3", sys.argv[0], "record")
+        print("e.g., python3", sys.argv[0], "new.json bench_baseline.json 0.25")
+        sys.exit(1)
+    path = sys.argv[1] if len(sys.argv) >= 2 else RESULTS_PATH
+    results = run()
+    with open(path, "w") as f:
+        json.dump(results, f, indent=1)
+    if len(sys.argv) >= 3:
+        with open(sys.argv[2]) as f:
+            baseline = json.load(f)
+        threshold = float(sys.argv[3]) if len(sys.argv) == 4 else THRESHOLD
+        regressions = compare(results, baseline, threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for case, seconds in results["results"].items():
+            print(f"{case:32} {seconds * 1e6:12.2f} us")
@@ -0,0 +1,368 @@
+from typing import List, Tuple, Dict, Optional, Any
+
+import os
+import sys
+import random
+import asyncio
+from time import monotonic
+from multiprocessing import get_context
+
+from rules import BOARD_WIDTH, BOARD_HEIGHT, get_table
+from wire import TERMINATOR, encode_message, decode, play_frame
+
+
+INVITE_TIMEOUT = 2.0 # Seconds a host waits for its invitation to start a game before trying another guest
+LOBBY_PAGE_SIZE = 20 # Players per lobby page asked by the bots, as clientB
+RTT_SAMPLES = 100000 # Round-trip times kept per process
+CONNECT_BATCH = 50 # Connections opened at once by a process
+CONNECT_TIMEOUT = 30.0 # Seconds to wait for the server to accept all the bots of a process
+
+
+class HeadlessClient(asyncio.Protocol):
+    """Connection to the game server without any user interface.
+
+    Speaks the same protocol as clientB: the messages received are
+    dispatched to the Network_<action> methods of the subclass, and the
+    binary frames of wire.py are used once the server accepted them.
+    """
+
+    def __init__(self, nickname: str, binary: bool = True) -> None:
+        self.nickname = nickname
+        self.binary = binary # Asked for, then what the server accepted
+        self.transport = None
+        self.ready = False # The server accepted the connection
+        self.closed = False
+        self._ibuffer = b""
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self._ibuffer += data
+        *messages, self._ibuffer = self._ibuffer.split(TERMINATOR)
+        for message in messages:
+            data = decode(message)
+            handler = getattr(self, "Network_" + data["action"], None)
+            if handler is not None:
+                handler(data)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.closed = True
+
+    def Send(self, data: Dict[str, Any]) -> None:
+        if not self.closed:
+            self.transport.write(encode_message(data))
+
+    def SendFrame(self, frame: bytes) -> None:
+        """Send a binary frame built by wire.py, terminator included"""
+        if not self.closed:
+            self.transport.write(frame)
+
+    def send_move(self, table: Any, sausage_id: int) -> None:
+        """Place a sausage, as its id when binary frames are on"""
+        if self.binary:
+            self.SendFrame(play_frame(sausage_id))
+        else:
+            self.Send({"action": "ovals", "ovals": table.sausages[sausage_id]})
+
+    def Network_connected(self, data: Dict[str, Any]) -> None:
+        self.ready = True
+        if self.binary:
+            self.Send({"action": "wire_format", "format": "binary"})
+        self.Send({"action": "nickname", "nickname": self.nickname})
+
+    def Network_wire_format(self, data: Dict[str, Any]) -> None:
+        self.binary = data["format"] == "binary"
+
+
+class BotStats:
+    """What the bots of one process measured"""
+
+    def __init__(self) -> None:
+        self.moves = 0 # Own moves confirmed by the server
+        self.games = 0 # Games finished, counted by each player
+        self.invalid_moves = 0
+        self.rtts: List[float] = [] # Seconds between a move and its confirmation, sampled
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def rtt(self, seconds: float) -> None:
+        if len(self.rtts) < RTT_SAMPLES:
+            self.rtts.append(seconds)
+        else:
+            self.rtts[random.randrange(RTT_SAMPLES)] = seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"moves": self.moves, "games": self.games,
+                "invalid_moves": self.invalid_moves, "rtts": self.rtts}
+
+
+class Bot(HeadlessClient):
+    """Scripted player: a "host" invites guests found in its lobby pages,
+    a "guest" accepts every invitation, an "idle" bot only watches the
+    lobby. Hosts and guests play random legal sausages until the game
+    ends, then go back to the lobby for another one.
+    """
+
+    def __init__(self, nickname: str, role: str, stats: BotStats,
+                 binary: bool = True, think: float = 0.0) -> None:
+        HeadlessClient.__init__(self, nickname, binary)
+        self.role = role
+        self.stats = stats
+        self.think = think # Seconds before playing, 0 to play as soon as possible
+        self.active = False # Hosts only invite once the measure started
+        self.playing = False
+        self.guests: List[str] = [] # Guests on the last lobby page
+        self.invited = None # Nickname of the last guest invited
+        self.lobby_pages = 1
+        self.invitation = 0 # Number of the pending invitation, to ignore stale timeouts
+        self.table = get_table(BOARD_WIDTH, BOARD_HEIGHT)
+        self.remaining = 0 # Sausage ids still playable
+        self.sent_at = None # When our last move was sent
+
+    def Network_connected(self, data: Dict[str, Any]) -> None:
+        HeadlessClient.Network_connected(self, data)
+        self.Send({"action": "lobby_subscribe", "mode": "window", "page_size": LOBBY_PAGE_SIZE})
+
+    def Network_nickname_error(self, data: Dict[str, Any]) -> None:
+        self.nickname += "_"
+        self.Send({"action": "nickname", "nickname": self.nickname})
+
+    def start(self) -> None:
+        """Begin to play, for the hosts"""
+        self.active = True
+        if self.role == "host":
+            self.invite()
+
+    def invite(self) -> None:
+        if self.closed or self.playing or not self.active:
+            return
+        self.invitation += 1
+        loop = asyncio.get_running_loop()
+        loop.call_later(INVITE_TIMEOUT, self.invite_timeout, self.invitation)
+        if self.guests:
+            self.invited = random.choice(self.guests)
+            self.Send({"action": "invite", "opponent": self.invited})
+        else:
+            # Look for guests on another page of our ELO window
+            self.Send({"action": "lobby_page", "page": random.randrange(self.lobby_pages)})
+
+    def invite_timeout(self, invitation: int) -> None:
+        if invitation == self.invitation:
+            self.invite()
+
+    def Network_lobby_page(self, data: Dict[str, Any]) -> None:
+        self.lobby_pages = data["pages"]
+        self.guests = [player["name"] for player in data["players"] if player["name"].startswith("guest")]
+
+    def Network_invite_request(self, data: Dict[str, Any]) -> None:
+        self.Send({"action": "invite_response", "accept": self.role == "guest" and self.active})
+
+    def Network_invite_error(self, data: Dict[str, Any]) -> None:
+        if self.invited in self.guests:
+            self.guests.remove(self.invited) # Out of reach until the next page
+        self.invite()
+
+    def Network_invite_rejected(self, data: Dict[str, Any]) -> None:
+        self.invite()
+
+    def Network_start_game(self, data: Dict[str, Any]) -> None:
+        self.playing = True
+        self.invitation += 1
+        self.table = get_table(data.get("columns", BOARD_WIDTH), data.get("rows", BOARD_HEIGHT))
+        self.remaining = self.table.full_mask
+        if data["your_turn"]:
+            self.turn()
+
+    def turn(self) -> None:
+        if self.think:
+            asyncio.get_running_loop().call_later(self.think, self.play)
+        else:
+            self.play()
+
+    def play(self) -> None:
+        """Place a random legal sausage"""
+        if not self.playing or self.closed:
+            return
+        remaining = self.remaining
+        moves = [i for i in range(remaining.bit_length()) if remaining >> i & 1]
+        if moves:
+            self.sent_at = monotonic()
+            self.send_move(self.table, random.choice(moves))
+
+    def placed(self, sausage_id: int, own_move: bool) -> None:
+        self.remaining = self.table.play(self.remaining, sausage_id)
+        if own_move and self.sent_at is not None:
+            self.stats.moves += 1
+            self.stats.rtt(monotonic() - self.sent_at)
+            self.sent_at = None
+
+    def Network_move(self, data: Dict[str, Any]) -> None:
+        """Binary frame: a sausage was placed and the turn changed"""
+        self.placed(data["sausage"], data["own_move"])
+        if data["your_turn"]:
+            self.turn()
+
+    def Network_valid_move(self, data: Dict[str, Any]) -> None:
+        self.placed(self.table.sausage_id(data["ovals"]), own_move=True)
+
+    def Network_ovals(self, data: Dict[str, Any]) -> None:
+        self.placed(self.table.sausage_id(data["ovals"]), own_move=False)
+
+    def Network_turn_update(self, data: Dict[str, Any]) -> None:
+        if data["your_turn"]:
+            self.turn()
+
+    def Network_invalid_move(self, data: Dict[str, Any]) -> None:
+        self.stats.invalid_moves += 1
+        self.sent_at = None
+        self.turn()
+
+    def Network_game_over(self, data: Dict[str, Any]) -> None:
+        self.stats.games += 1
+        self.back_to_lobby()
+
+    def Network_opponent_disconnected(self, data: Dict[str, Any]) -> None:
+        self.back_to_lobby()
+
+    def back_to_lobby(self) -> None:
+        self.playing = False
+        self.sent_at = None
+        if self.role == "host":
+            self.invite()
+
+
+def role(index: int, games: int) -> str:
+    """Role of the bot number `index` when `games` games are played at once"""
+    if index < games:
+        return "host"
+    if index < 2 * games:
+        return "guest"
+    return "idle"
+
+
+async def run_bots(host: str, port: int, indexes: List[int], games: int, duration: float,
+                   barrier: Any, binary: bool = True, think: float = 0.0) -> Dict[str, Any]:
+    """Connect the bots of one process, wait for the other processes, then
+    play for `duration` seconds and return the stats"""
+    loop = asyncio.get_running_loop()
+    stats = BotStats()
+    bots: List[Bot] = []
+    failed = 0
+    for start in range(0, len(indexes), CONNECT_BATCH):
+        batch = [Bot(f"{role(i, games)}{i}", role(i, games), stats, binary, think)
+                 for i in indexes[start:start + CONNECT_BATCH]]
+        results = await asyncio.gather(
+            *(loop.create_connection(lambda bot=bot: bot, host, port) for bot in batch),
+            return_exceptions=True
+            )
+        for bot, result in zip(batch, results):
+            if isinstance(result, Exception):
+                failed += 1
+            else:
+                bots.append(bot)
+    deadline = monotonic() + CONNECT_TIMEOUT
+    while not all(bot.ready or bot.closed for bot in bots) and monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(1.0) # Let the nicknames and lobby pages arrive
+    await loop.run_in_executor(None, barrier.wait)
+    stats.reset()
+    for bot in bots:
+        bot.start()
+    await asyncio.sleep(duration)
+    result = stats.as_dict()
+    result["connected"] = sum(bot.ready and not bot.closed for bot in bots)
+    result["failed"] = failed + sum(not bot.ready for bot in bots)
+    for bot in bots:
+        bot.transport.close()
+    return result
+
+
+def run_process(host: str, port: int, indexes: List[int], games: int, duration: float,
+                barrier: Any, results: Any, binary: bool, think: float) -> None:
+    results.put(asyncio.run(run_bots(host, port, indexes, games, duration, barrier, binary, think)))
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    """User and system CPU time used by a process so far, None if unknown (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def load_test(host: str, port: int, players: int, games: int, duration: float = 30.0,
+              processes: int = 1, server_pids: Tuple[int, ...] = (),
+              binary: bool = True, think: float = 0.0) -> Dict[str, Any]:
+    """Run `players` bots over `processes` processes, with up to `games`
+    games played at once, and measure the server for `duration` seconds.
+
+    Returns:
+        dict: moves, moves_per_second, games, rtt_p50 and rtt_p99 (seconds),
+            server_cpu (fraction of one core, None without server_pids),
+            connected, failed and invalid_moves
+    """
+    games = min(games, players // 2)
+    context = get_context("spawn")
+    barrier = context.Barrier(processes + 1)
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_process, args=(host, port, list(range(n, players, processes)),
+                                                  games, duration, barrier, results, binary, think))
+        for n in range(processes)
+        ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = monotonic()
+    cpu_start = [cpu_seconds(pid) for pid in server_pids]
+    merged = [results.get() for _ in workers]
+    elapsed = monotonic() - start
+    cpu_end = [cpu_seconds(pid) for pid in server_pids]
+    for worker in workers:
+        worker.join()
+
+    rtts = sorted(rtt for result in merged for rtt in result["rtts"])
+    moves = sum(result["moves"] for result in merged)
+    cpu = None
+    if server_pids and None not in cpu_start + cpu_end:
+        cpu = (sum(cpu_end) - sum(cpu_start)) / elapsed
+    return {
+        "moves": moves,
+        "moves_per_second": moves / duration,
+        "games": sum(result["games"] for result in merged) // 2,
+        "rtt_p50": percentile(rtts, 0.50) if rtts else None,
+        "rtt_p99": percentile(rtts, 0.99) if rtts else None,
+        "server_cpu": cpu,
+        "connected": sum(result["connected"] for result in merged),
+        "failed": sum(result["failed"] for result in merged),
+        "invalid_moves": sum(result["invalid_moves"] for result in merged)
+        }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5, 6, 7):
+        print("Please use: python3", sys.argv[0], "host:port players games [seconds [processes [server_pids]]]")
+        print("e.g., python3", sys.argv[0], "localhost:31425 2000 500 30 4 12345")
+        sys.exit(1)
+    host, port = sys.argv[1].split(":")
+    players, games = int(sys.argv[2]), int(sys.argv[3])
+    duration = float(sys.argv[4]) if len(sys.argv) >= 5 else 30.0
+    processes = int(sys.argv[5]) if len(sys.argv) >= 6 else 1
+    pids = tuple(int(pid) for pid in sys.argv[6].split(",")) if len(sys.argv) == 7 else ()
+    report = load_test(host, int(port), players, games, duration, processes, pids)
+    print(f"{report['connected']} players connected ({report['failed']} failed), "
+          f"up to {min(games, players // 2)} games at once, {duration:.0f}s")
+    print(f"{report['moves']} moves, {report['moves_per_second']:.1f} moves/s, "
+          f"{report['games']} games finished, {report['invalid_moves']} invalid moves")
+    if report["rtt_p50"] is not None:
+        print(f"Move round trip: p50 {report['rtt_p50'] * 1000:.2f} ms, p99 {report['rtt_p99'] * 1000:.2f} ms")
+    if report["server_cpu"] is not None:
+        print(f"Server CPU: {report['server_cpu'] * 100:.1f}% of a core")
@@ -7,7 +7,12 @@ from tkinter import *
 from tkinter import messagebox
 import re
 
-from PodSixNet.Connection import connection, ConnectionListener
+import PodSixNet.Connection
+from PodSixNet.Connection import ConnectionListener
+from PodSixNet.EndPoint import EndPoint
+
+from rules import get_table
+from wire import decode, play_frame
 
 MAX_ELO_DIFFERENCE = 300
 
@@ -39,6 +44,27 @@ OPPONENT_COLOR = "darkviolet"
 
 INVALID_NODE = "SteelBlue4" 
 
+class WireEndPoint(EndPoint):
+    """PodSixNet connection that also understands the binary frames of wire.py"""
+    
+    def found_terminator(self):
+        data = decode(self._ibuffer)
+        self._ibuffer = b""
+        if isinstance(data, dict) and "action" in data:
+            for name in ("Network_" + data["action"], "Network"):
+                if hasattr(self, name):
+                    getattr(self, name)(data)
+        else:
+            print("OOB data:", data)
+    
+    def SendFrame(self, frame: bytes) -> None:
+        """Queue a binary frame built by wire.py, terminator included"""
+        self.sendqueue.append(frame)
+
+# ConnectionListener uses the connection of the PodSixNet.Connection module
+connection = PodSixNet.Connection.connection = WireEndPoint()
+
+
 class Client(ConnectionListener):
     def __init__(self, host: str, port: Union[str, int], window: 'ClientWindow') -> None:
         self.window = window
@@ -47,8 +73,21 @@ class Client(ConnectionListener):
         self.elo = 1000
         self.nickname = ""
         self.opponent_name = ""
+        self.lobby = {} # Waiting players: ID -> {"name", "elo"}
+        self.lobby_version = None
+        self.lobby_page = 0
+        self.lobby_pages = 1
+        self.podium = []
+        self.top = {} # Nickname -> global rank, of the best players of the leaderboard
+        self.rank = None # Our global rank
+        self.binary = False # Binary frames accepted by the server
+        self.table = get_table(COLUMNS, ROWS) # Sausage ids of the current board
         print("Client started")
         print("Ctrl-C to exit the lobby")
+        self.ask_nickname()
+    
+    def ask_nickname(self) -> None:
+        """Read the nickname on stdin and send it to the server"""
         print("Enter your nickname: ")
         nickname = stdin.readline().rstrip("\n")
         self.nickname = nickname
@@ -69,10 +108,86 @@ class Client(ConnectionListener):
     def Network_connected(self, data: Dict[str, Any]) -> None:
         print("You are now connected to the server")
         self.state = LOBBY
+        self.Send({"action": "wire_format", "format": "binary"})
+        # Only the players we can invite, a page at a time, plus the podium
+        self.Send({"action": "lobby_subscribe", "mode": "window"})
+        self.Send({"action": "leaderboard_top"})
+    
+    def Network_wire_format(self, data: Dict[str, Any]) -> None:
+        """The server accepted (or not) the binary frames."""
+        self.binary = data["format"] == "binary"
+    
+    def Network_nickname_error(self, data: Dict[str, Any]) -> None:
+        """The nickname is already used by another player."""
+        print(data["message"])
+        self.ask_nickname()
     
     def Network_lobby_update(self, data: Dict[str, Any]) -> None:
-        """Update lobby player list."""
+        """Full lobby player list."""
+        self.lobby = {player["id"]: player for player in data["players"]}
+        self.lobby_version = data["version"]
         self.window.update_lobby(data["players"])
+    
+    def Network_lobby_delta(self, data: Dict[str, Any]) -> None:
+        """Apply the lobby changes, or ask for a full list if one was missed."""
+        if self.lobby_version is None:
+            return # The full list is on its way
+        if data["version"] != self.lobby_version + 1:
+            self.lobby_version = None
+            self.Send({"action": "lobby_resync"})
+            return
+        self.lobby_version = data["version"]
+        for player in data["join"] + data["update"]:
+            self.lobby[player["id"]] = player
+        for player_id in data["leave"]:
+            self.lobby.pop(player_id, None)
+        self.window.update_lobby(sorted(self.lobby.values(), key=lambda x: x["elo"], reverse=True))
+    
+    def Network_lobby_page(self, data: Dict[str, Any]) -> None:
+        """One page of the waiting players within our ELO window."""
+        self.lobby = {player["id"]: player for player in data["players"]}
+        self.lobby_page = data["page"]
+        self.lobby_pages = data["pages"]
+        self.podium = data["podium"]
+        self.show_lobby_page()
+    
+    def Network_lobby_podium(self, data: Dict[str, Any]) -> None:
+        """The best players changed."""
+        self.podium = data["podium"]
+        self.show_lobby_page()
+    
+    def show_lobby_page(self) -> None:
+        """Display the podium followed by the current page, by rank"""
+        players = {player["id"]: player for player in self.podium}
+        players.update(self.lobby)
+        self.window.update_lobby(sorted(players.values(), key=lambda x: x["elo"], reverse=True))
+        self.window.page_label.config(text=f"Page {self.lobby_page + 1}/{self.lobby_pages}")
+    
+    def change_lobby_page(self, step: int) -> None:
+        """Ask for the previous (-1) or next (+1) lobby page"""
+        page = self.lobby_page + step
+        if 0 <= page < self.lobby_pages:
+            self.Send({"action": "lobby_page", "page": page})
+    
+    def Network_queue_joined(self, data: Dict[str, Any]) -> None:
+        """We wait for an automatic match."""
+        text = f"Searching an opponent ({data['queued']} in queue"
+        if data["median_wait"] is not None:
+            text += f", median wait {data['median_wait']:.1f}s"
+        self.window.status_label.config(text=text + ")")
+        self.window.queue_button.config(text="Cancel search", command=self.leave_queue)
+    
+    def Network_queue_left(self, data: Dict[str, Any]) -> None:
+        self.window.reset_queue_button()
+    
+    def Network_queue_error(self, data: Dict[str, Any]) -> None:
+        self.window.status_label.config(text=data["message"])
+    
+    def join_queue(self) -> None:
+        self.Send({"action": "queue_join"})
+    
+    def leave_queue(self) -> None:
+        self.Send({"action": "queue_leave"})
         
     def Network_invite_request(self, data: Dict[str, Any]) -> None:
         """"Response to an incoming game invitation."""
@@ -98,11 +213,37 @@ class Client(ConnectionListener):
     def Network_invite_rejected(self, data: Dict[str, Any]) -> None:
         messagebox.showinfo("Invitation Declined", "The player declined your invitation")
     
+    def Network_leaderboard_top(self, data: Dict[str, Any]) -> None:
+        """The best players of the whole leaderboard changed."""
+        self.top = {player["name"]: player["rank"] for player in data["players"]}
+        self.show_lobby_page()
+    
+    def Network_leaderboard_rank(self, data: Dict[str, Any]) -> None:
+        """Global rank of a player, ours when we asked after an ELO change."""
+        if data["nickname"] == self.nickname:
+            self.rank = data["rank"]
+            self.show_elo()
+    
+    def show_elo(self, change: Optional[int] = None) -> None:
+        text = f"Your ELO: {self.elo}"
+        if change is not None:
+            text += f" ({change:+})"
+        if self.rank is not None:
+            text += f" - rank #{self.rank}"
+        self.window.elo_label.config(text=text)
+    
+    def Network_rating(self, data: Dict[str, Any]) -> None:
+        """ELO kept by the server for the chosen nickname."""
+        self.elo = data["elo"]
+        self.show_elo()
+        self.Send({"action": "leaderboard_rank"})
+    
     def Network_elo_update(self, data: Dict[str, Any]) -> None:
         """Update ELO rating display."""
         self.elo = data["new_elo"]
         change = data["elo_change"]
-        self.window.elo_label.config(text=f"Your ELO: {self.elo} ({change:+})")
+        self.show_elo(change)
+        self.Send({"action": "leaderboard_rank"})
         messagebox.showinfo(
             "ELO Updated",
             f"New ELO: {self.elo}\n"
@@ -114,13 +255,32 @@ class Client(ConnectionListener):
         self.state = PLAYING
         your_turn = data.get("your_turn", False)
         self.opponent_name = data["opponent"]
-        self.window.start_game(data["opponent"], data["your_turn"], your_turn)
+        self.table = get_table(data.get("columns", COLUMNS), data.get("rows", ROWS))
+        self.window.start_game(data["opponent"], data["your_turn"], your_turn,
+                               data.get("columns", COLUMNS), data.get("rows", ROWS))
     
     def Network_ovals(self, data: Dict[str, Any]) -> None:
         """Draw opponent's sausage"""
         points = data["ovals"]
         self.window.draw_opponent_move(points)
         
+    def Network_move(self, data: Dict[str, Any]) -> None:
+        """Binary frame: a sausage was placed and the turn changed."""
+        points = self.table.sausages[data["sausage"]]
+        if data["own_move"]:
+            self.Network_valid_move({"ovals": points})
+        else:
+            self.Network_ovals({"ovals": points})
+        self.Network_turn_update(data)
+    
+    def send_move(self, points: List[Tuple[int, int]]) -> None:
+        """Send a sausage, as its id when binary frames are on"""
+        sausage_id = self.table.sausage_id(points)
+        if self.binary and sausage_id >= 0:
+            connection.SendFrame(play_frame(sausage_id))
+        else:
+            connection.Send({"action": "ovals", "ovals": points})
+        
     def Network_turn_update(self, data: Dict[str, Any]) -> None:
         """Update turn indicator."""
         self.window.update_turn(data["your_turn"])
@@ -167,10 +327,18 @@ class ClientWindow(Tk):
         self.elo_label.pack(pady=5)
         self.players_list = Listbox(self.lobby_frame, bg=LOBBY_BG, fg=LOBBY_FG, height=10, width=30, highlightthickness=0)
         self.invite_button = Button(self.lobby_frame, bg=LOBBY_BTN, fg=LOBBY_FG, text="Invite", command=self.invite_player)
+        self.queue_button = Button(self.lobby_frame, bg=LOBBY_BTN, fg=LOBBY_FG, text="Quick match", command=self.client.join_queue)
         self.status_label = Label(self.lobby_frame, bg=LOBBY_BG, fg=LOBBY_FG, text="Select a player to invite")
+        self.page_frame = Frame(self.lobby_frame, bg=LOBBY_BG)
+        self.page_label = Label(self.page_frame, bg=LOBBY_BG, fg=LOBBY_FG, text="Page 1/1")
+        Button(self.page_frame, bg=LOBBY_BTN, fg=LOBBY_FG, text="<", command=lambda: self.client.change_lobby_page(-1)).pack(side=LEFT)
+        self.page_label.pack(side=LEFT, padx=5)
+        Button(self.page_frame, bg=LOBBY_BTN, fg=LOBBY_FG, text=">", command=lambda: self.client.change_lobby_page(1)).pack(side=LEFT)
         
         self.players_list.pack(pady=10)
+        self.page_frame.pack()
         self.invite_button.pack(pady=5)
+        self.queue_button.pack(pady=5)
         self.status_label.pack()
         self.lobby_frame.pack()
         
@@ -188,6 +356,8 @@ class ClientWindow(Tk):
         self.occupied_points = set()
         self.client.occupied_points = self.occupied_points
         self.current_turn = False
+        self.columns = COLUMNS
+        self.rows = ROWS
         
         self.init_board()
         
@@ -195,8 +365,8 @@ class ClientWindow(Tk):
     
     def init_board(self) -> None:
         """Initialize game board with clickable points."""
-        for col in range(COLUMNS):
-            for row in range(ROWS):
+        for col in range(self.columns):
+            for row in range(self.rows):
                 if (col + row) % 2 == 0:
                     x = col * CELL_SIZE + CELL_SIZE//2
                     y = row * CELL_SIZE + CELL_SIZE//2
@@ -254,7 +424,8 @@ class ClientWindow(Tk):
         self.players_list.delete(0, END)
         for i, player in enumerate(players_data):
             if player["name"] != self.client.nickname:
-                rank = i + 1
+                rank = player.get("rank", i + 1) # Global rank, as sent by the server
+                podium = self.client.top.get(player["name"]) # Kept up to date by the server
                 name = player["name"]
                 elo = player["elo"]
                 elo_diff = abs(self.client.elo - elo)
@@ -264,15 +435,15 @@ class ClientWindow(Tk):
                 color = LOBBY_FG
 
                 # Podium colors
-                if rank == 1:
+                if podium == 1:
                     color = "gold"
-                elif rank == 2:
+                elif podium == 2:
                     color = "silver"
-                elif rank == 3:
+                elif podium == 3:
                     color = "brown"
             
                 # Large ELO difference - red (except for podium)
-                if elo_diff > MAX_ELO_DIFFERENCE and rank > 3:
+                if elo_diff > MAX_ELO_DIFFERENCE and podium is None:
                     color = "red"
 
                 self.players_list.itemconfig(END, fg=color)
@@ -292,8 +463,15 @@ class ClientWindow(Tk):
             else:
                 self.status_label.config(text="Error: Could not send invitation")
     
-    def start_game(self, opponent, opponent_elo, your_turn):
+    def start_game(self, opponent, opponent_elo, your_turn, columns=COLUMNS, rows=ROWS):
         """Initialize game view."""
+        if (columns, rows) != (self.columns, self.rows):
+            # The board size is chosen per game by the server
+            self.columns, self.rows = columns, rows
+            self.white_board_canvas.config(width=columns * CELL_SIZE, height=rows * CELL_SIZE)
+            self.white_board_canvas.delete("all")
+            self.init_board()
+        self.reset_queue_button()
         self.lobby_frame.pack_forget()
         self.game_frame.pack()
         self.title(f"Sausage Game - VS - {opponent} ") #(ELO: {opponent_elo})
@@ -310,6 +488,11 @@ class ClientWindow(Tk):
         self.white_board_canvas.delete("line")
         self.init_board()
     
+    def reset_queue_button(self):
+        """Back to the lobby state, out of the matchmaking queue"""
+        self.queue_button.config(text="Quick match", command=self.client.join_queue)
+        self.status_label.config(text="Select a player to invite")
+    
     def reset_selection(self):
         """Reset current node selection."""
         for col, row in self.selected_points:
@@ -342,10 +525,7 @@ class ClientWindow(Tk):
             
             if len(self.selected_points) == 3:
                 if self.validate_local_sausage(self.selected_points):
-                    connection.Send({
-                        "action": "ovals",
-                        "ovals": self.selected_points
-                        })
+                    self.client.send_move(self.selected_points)
                 else:
                     self.show_error_message("The distance between all points must be <= 2")
                     self.reset_selection()
@@ -437,7 +617,7 @@ class ClientWindow(Tk):
         """Display temporary error message."""
         self.white_board_canvas.delete("error_msg")
         self.white_board_canvas.create_text(
-            WIDTH_PLATEAU//2, 20,
+            self.columns * CELL_SIZE//2, 20,
             text=message,
             fill="red",
             font=('Helvetica', 12, 'bold'),
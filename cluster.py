@@ -0,0 +1,360 @@
+from typing import List, Dict, Optional, Any, Callable
+
+import os
+import sys
+import socket
+import asyncio
+from itertools import count
+
+from PodSixNet.rencode import loads
+
+from core import Player
+from wire import TERMINATOR, encode_message
+from registry import PlayerRegistry
+
+
+NODE_ID_STRIDE = 1 << 32 # Player IDs of node n start at n * NODE_ID_STRIDE
+RELAYED_ACTIONS = ("ovals", "game_over", "player_quit") # Sent to the node hosting the game
+
+
+class BrokerChannel(asyncio.Protocol):
+    """Connection of one server node to the broker"""
+
+    def __init__(self, broker: 'Broker') -> None:
+        self.broker = broker
+        self.node = None
+        self.transport = None
+        self._ibuffer = b""
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        self.broker.join(self)
+
+    def data_received(self, data: bytes) -> None:
+        self._ibuffer += data
+        *messages, self._ibuffer = self._ibuffer.split(TERMINATOR)
+        for message in messages:
+            self.broker.route(self, loads(message))
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.broker.leave(self)
+
+
+class Broker:
+    """Pub/sub process relaying the messages of the server nodes.
+
+    A message is stamped with the node that sent it, then delivered to
+    its "to_node" if it has one, or else to every other node. Nodes get
+    a "welcome" with their number when they connect, and a "node_down"
+    is published when one goes away.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.nodes: Dict[int, BrokerChannel] = {}
+        self._node_ids = count(1)
+
+    def join(self, channel: BrokerChannel) -> None:
+        channel.node = next(self._node_ids)
+        self.nodes[channel.node] = channel
+        channel.transport.write(encode_message({"action": "welcome", "node": channel.node}))
+        print(f"Node {channel.node} joined")
+
+    def leave(self, channel: BrokerChannel) -> None:
+        del self.nodes[channel.node]
+        print(f"Node {channel.node} left")
+        payload = encode_message({"action": "node_down", "node": channel.node})
+        for other in self.nodes.values():
+            other.transport.write(payload)
+
+    def route(self, sender: BrokerChannel, message: Dict[str, Any]) -> None:
+        message["node"] = sender.node
+        payload = encode_message(message)
+        if "to_node" in message:
+            target = self.nodes.get(message["to_node"])
+            if target is not None:
+                target.transport.write(payload)
+        else:
+            for other in self.nodes.values():
+                if other is not sender:
+                    other.transport.write(payload)
+
+    async def Serve(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path) # Left by a previous broker
+        server = await asyncio.get_running_loop().create_unix_server(
+            lambda: BrokerChannel(self), self.path
+            )
+        print('Broker launched')
+        async with server:
+            await server.serve_forever()
+
+    def Launch(self) -> None:
+        asyncio.run(self.Serve())
+
+
+class UnixBroker:
+    """Link of a server node to the Broker process, over a Unix socket.
+
+    The socket is non-blocking once the node got its number: publish()
+    only queues a message, and the transport of the node calls flush()
+    when the socket is writable, so a slow broker never stalls the main
+    loop. Another broker only has to provide the same `node` number,
+    `on_pending`, fileno(), publish(), pending(), flush() and receive()."""
+
+    def __init__(self, path: str) -> None:
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self._ibuffer = b""
+        self._obuffer = bytearray() # Published, not accepted by the socket yet
+        self._pending = []
+        while not self._pending:
+            self._pending = self._read()
+        welcome = self._pending.pop(0)
+        self.node = welcome["node"]
+        self.socket.setblocking(False)
+        # Called when a message is queued while nothing else was, for a
+        # transport that only watches the socket while data is waiting
+        self.on_pending: Optional[Callable[[], None]] = None
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        """Queue a message for the broker, written by flush()"""
+        if not self._obuffer and self.on_pending is not None:
+            self.on_pending()
+        self._obuffer += encode_message(message)
+
+    def pending(self) -> int:
+        """Bytes published and not written yet"""
+        return len(self._obuffer)
+
+    def flush(self) -> None:
+        """Write what the socket accepts of the queued messages, to call
+        when it is writable.
+
+        Raises:
+            ConnectionError: The broker is gone
+        """
+        try:
+            sent = self.socket.send(self._obuffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        del self._obuffer[:sent]
+
+    def receive(self) -> List[Dict[str, Any]]:
+        """Messages from the broker, to call when the socket is readable.
+
+        Raises:
+            ConnectionError: The broker is gone
+        """
+        messages, self._pending = self._pending + self._read(), []
+        return messages
+
+    def _read(self) -> List[Dict[str, Any]]:
+        try:
+            data = self.socket.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return []
+        if not data:
+            raise ConnectionError("The broker closed the connection")
+        self._ibuffer += data
+        *messages, self._ibuffer = self._ibuffer.split(TERMINATOR)
+        return [loads(message) for message in messages]
+
+
+class RemotePlayer(Player):
+    """A player connected to another node, as seen from this one.
+
+    Its lobby entry follows the "presence" messages of its node, and the
+    messages sent to it are relayed to that node."""
+
+    def __init__(self, cluster: 'ClusterNode', node: int, player_id: int) -> None:
+        self.init_player()
+        self._server = cluster.server
+        self.cluster = cluster
+        self.home_node = node
+        self.player_id = player_id
+        self.connected = True
+
+    def Send(self, data: Dict[str, Any]) -> int:
+        self.cluster.broker.publish({
+            "action": "relay_out",
+            "to_node": self.home_node,
+            "player": self.player_id,
+            "data": data
+            })
+        return 0
+
+
+class ClusterNode:
+    """Shares the lobby of a GameServer with the other nodes of a broker.
+
+    Every node publishes the lobby entries of its own players, and shows
+    the ones of the other nodes through RemotePlayer stand-ins, so that
+    FindPlayer() and the lobby cover the whole cluster. A game between
+    players of two nodes is hosted by the node of the player who accepted
+    the invitation: the other node relays the moves of its player there,
+    and forwards back what the host sends to it.
+    """
+
+    def __init__(self, server: Any, broker: UnixBroker) -> None:
+        self.server = server
+        self.broker = broker
+        self.node = broker.node
+        self.remote = PlayerRegistry() # RemotePlayer stand-ins, by ID and nickname
+        server.cluster = self
+        server._player_ids = count(self.node * NODE_ID_STRIDE + 1)
+        broker.publish({"action": "hello"})
+
+    def find(self, nickname: str) -> Optional[RemotePlayer]:
+        return self.remote.find(nickname)
+
+    def publish_presence(self, players: List[Player]) -> None:
+        """Tell the other nodes about the lobby entries of local players"""
+        self.broker.publish({"action": "presence", "players": [self._entry(p) for p in players]})
+
+    def _entry(self, player: Player) -> Dict[str, Any]:
+        return {
+            "id": player.player_id,
+            "name": player.nickname,
+            "elo": player.elo,
+            "status": player.status,
+            "connected": player.connected
+            }
+
+    def relay(self, player: Player, data: Dict[str, Any]) -> None:
+        """Send a message of a local player to the node hosting its game"""
+        self.broker.publish({
+            "action": "relay_in",
+            "to_node": player.relay_node,
+            "player": player.player_id,
+            "data": data
+            })
+
+    def receive(self) -> bool:
+        """Handle the messages waiting from the broker, False once it is gone"""
+        try:
+            messages = self.broker.receive()
+        except ConnectionError:
+            self._lost()
+            return False
+        for message in messages:
+            getattr(self, "Network_" + message["action"])(message)
+        return True
+
+    def write(self) -> bool:
+        """Send the messages queued for the broker, to call when its socket
+        is writable, False once it is gone"""
+        if self.server.cluster is not self:
+            return False
+        try:
+            self.broker.flush()
+        except ConnectionError:
+            self._lost()
+            return False
+        return True
+
+    def _lost(self) -> None:
+        if self.server.cluster is not self:
+            return # Already seen by the other direction
+        print("Lost the broker, running alone")
+        for node in {player.home_node for player in self.remote}:
+            self.Network_node_down({"node": node})
+        self.server.cluster = None
+
+    def Network_hello(self, message: Dict[str, Any]) -> None:
+        """A node joined: send it our players"""
+        self.broker.publish({
+            "action": "presence",
+            "to_node": message["node"],
+            "players": [self._entry(p) for p in self.server.players]
+            })
+
+    def Network_presence(self, message: Dict[str, Any]) -> None:
+        for entry in message["players"]:
+            player = self.remote.by_id.get(entry["id"])
+            if not entry["connected"]:
+                if player is not None:
+                    self._forget(player)
+                continue
+            if player is None:
+                player = RemotePlayer(self, message["node"], entry["id"])
+                self.remote.add(player)
+            self.remote.rename(player, entry["name"])
+            player.elo = entry["elo"]
+            if player.game_id is None or player.game_id not in self.server.games:
+                player.status = entry["status"] # Unless it plays here
+            self.server.UpdateLobby(player)
+
+    def Network_relay_out(self, message: Dict[str, Any]) -> None:
+        """A message from the node hosting a game, for one of our players"""
+        player = self.server.players.by_id.get(message["player"])
+        if player is None:
+            return
+        data = message["data"]
+        action = data["action"]
+        if action == "invite_request":
+            if player.status != "waiting": # Sent on a stale presence, the player started another game since
+                inviter = self.find(data["from"])
+                if inviter is not None:
+                    inviter.Send({"action": "invite_rejected", "message": f"{player.nickname} is already playing"})
+                return
+            player.pending_invitation = {
+                "from": data["from"],
+                "from_elo": data["from_elo"],
+                "elo_diff": data["elo_diff"],
+                "board_size": (data["columns"], data["rows"])
+                }
+        elif action == "start_game":
+            self.server.matchmaking.remove(player)
+            player.status = "playing"
+            player.relay_node = message["node"]
+            self.server.UpdateLobby(player)
+        elif action == "elo_update":
+            player.elo = data["new_elo"]
+        elif action in ("game_over", "opponent_disconnected") and player.relay_node is not None:
+            self._back_to_lobby(player)
+        player.Send(data)
+
+    def Network_relay_in(self, message: Dict[str, Any]) -> None:
+        """A message of a remote player playing a game hosted here"""
+        player = self.remote.by_id.get(message["player"])
+        data = message["data"]
+        if player is not None and data["action"] in RELAYED_ACTIONS:
+            getattr(player, "Network_" + data["action"])(data)
+
+    def Network_node_down(self, message: Dict[str, Any]) -> None:
+        node = message["node"]
+        for player in self.remote:
+            if player.home_node == node:
+                self._forget(player)
+        for player in self.server.players:
+            if player.relay_node == node:
+                player.Send({"action": "opponent_disconnected"})
+                self._back_to_lobby(player)
+
+    def _forget(self, player: RemotePlayer) -> None:
+        """Remove a remote player, ending the game it plays here"""
+        self.remote.remove(player)
+        self.server.DelPlayer(player)
+
+    def _back_to_lobby(self, player: Player) -> None:
+        player.status = "waiting"
+        player.relay_node = None
+        player.game_id = None
+        self.server.UpdateLobby(player)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Please use: python3", sys.argv[0], "socket_path")
+        print("e.g., python3", sys.argv[0], "/tmp/sausage.sock")
+        path = "/tmp/sausage.sock"
+    else:
+        path = sys.argv[1]
+    try:
+        Broker(path).Launch()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,1102 @@
+from typing import List, Tuple, Dict, Optional, Union, Any, Callable
+
+import signal
+from time import monotonic, perf_counter
+from random import choice
+from heapq import heappush, heappop
+from itertools import count
+from functools import partial
+from urllib.parse import urlsplit, parse_qs
+
+from rules import (BOARD_WIDTH, BOARD_HEIGHT, BOARD_SIZES, DEFAULT_TABLE,
+                   get_table, as_points, sausages_cross, segments_intersect)
+from game import Game, GameIdAllocator
+from registry import PlayerRegistry, EloIndex, Leaderboard
+from matchmaking import MatchQueue
+from shards import ShardPool, RemoteGame
+from ratings import RatingStore, RATINGS_PATH
+from elo import MAX_ELO_DIFFERENCE, HIGH_ELO_DIFFERENCE, INITIAL_ELO, RatingEngine, elo_points
+from wire import encode_message, encode, move_frame
+from metrics import Metrics
+from profiler import SamplingProfiler, PROFILE_SIGNAL, PROFILE_WINDOW, MAX_PROFILE_WINDOW
+
+
+PODIUM_SIZE = 3 # Best players always shown in windowed lobbies
+LOBBY_PAGE_SIZE = 20 # Default number of players per lobby page
+MAX_LOBBY_PAGE_SIZE = 100
+LOBBY_SUBSCRIBE_DELAY = 2.0 # Seconds a new client has to send lobby_subscribe before it gets the full lobby
+MAX_LEADERBOARD_ENTRIES = 100 # Most players sent by one leaderboard query
+LEADERBOARD_LOAD_BATCH = 1000 # Stored ratings added to the leaderboard per tick after startup
+
+MATCHMAKING_INTERVAL = 0.25 # Seconds between two pairings of the matchmaking queue
+
+SEND_QUEUE_LIMIT = 1 << 20 # Bytes waiting for a client above which its lobby messages are dropped
+SEND_QUEUE_TIMEOUT = 10.0 # Seconds a client may stay above the limit before being disconnected
+BACKLOG_CHECK_INTERVAL = 1.0 # Seconds between two checks of the clients above the limit
+
+
+class Player:
+    """Handlers of the messages sent by a client, whatever the transport.
+    
+    A transport mixes this class into its channel type, calls init_player()
+    once connected, passes the received messages to Dispatch() and
+    provides Send(data), SendEncoded(payload, action), QueuedBytes(),
+    Disconnect() and the `_server` attribute."""
+    
+    def init_player(self) -> None:
+        self.nickname = "anonymous"
+        self.status = "waiting" # "waiting", "queued" (matchmaking) or "playing"
+        self.opponent = None # Nickname of the current opponent
+        self.game_id = None # Current game ID
+        self.elo = INITIAL_ELO # ELO (score)
+        self.pending_invitation = None # If there is an incoming game invitation
+        self.player_id = None # Set by the server, identifies the player in the lobby
+        self.connected = False
+        self.lobby_mode = None # "full" or "window" (players within MAX_ELO_DIFFERENCE), None until chosen
+        self.lobby_page = 0
+        self.lobby_page_size = LOBBY_PAGE_SIZE
+        self.lobby_pages = 0 # Number of pages in the last lobby_page sent
+        self.home_node = None # Cluster node of a remote player, None for a local one
+        self.relay_node = None # Cluster node hosting the game of a local player, if not this one
+        self.binary_wire = False # Compact frames negotiated with wire_format, see wire.py
+        self.dropped_messages = 0 # Lobby messages not sent because the client was too far behind
+        self.lobby_stale = False # Lobby messages were dropped, a fresh snapshot is owed
+        self.backlogged_since = None # When the send queue went over SEND_QUEUE_LIMIT
+    
+    def Close(self):
+        """"Called when the client disconnects"""
+        self._server.DelPlayer(self)
+    
+    def Dispatch(self, data: Dict[str, Any]) -> None:
+        """Call the handlers of a message like PodSixNet channels do, timed
+        when the server keeps metrics and seen by its profiler if one runs"""
+        metrics, profiler = self._server.metrics, self._server.profiler
+        if metrics is None and profiler is None:
+            self._handle(data)
+            return
+        # Any action a client makes up would otherwise get its own histogram
+        action = data["action"] if hasattr(self, "Network_" + data["action"]) else "unknown"
+        start = perf_counter()
+        if profiler is not None:
+            profiler.action = action
+        try:
+            self._handle(data)
+        finally:
+            if profiler is not None:
+                profiler.action = None
+        if metrics is not None:
+            metrics.handled(action, start)
+    
+    def _handle(self, data: Dict[str, Any]) -> None:
+        for name in ("Network_" + data["action"], "Network"):
+            if hasattr(self, name):
+                getattr(self, name)(data)
+    
+    def Network_nickname(self, data: Dict[str, str]) -> None:
+        """"To Change player's nickname
+        
+        Args:
+            data: Dictionary containing new nickname under "nickname" key """
+            
+        owner = self._server.FindPlayer(data["nickname"]) # Also on the other nodes
+        if (owner is not None and owner is not self) or not self._server.players.rename(self, data["nickname"]):
+            self.Send({
+                "action": "nickname_error",
+                "message": f"The nickname {data['nickname']} is already taken"
+                })
+            return
+        self._server.LoadRating(self)
+        self._server.UpdateLobby(self)
+    
+    def Network_invite(self, data: Dict[str, Any]) -> None:
+        """"To check if 2 players can confront
+        
+        Args:
+            data (dict): 'opponent' nickname, and optionally the 'columns'
+                and 'rows' of the board to play on"""
+        opponent_nick = data["opponent"]
+        opponent = self._server.FindPlayer(opponent_nick)
+        board_size = (data.get("columns", self._server.board_size[0]),
+                      data.get("rows", self._server.board_size[1]))
+        
+        if board_size not in BOARD_SIZES:
+            self.Send({
+                "action": "invite_error",
+                "message": f"Unknown board size {board_size[0]}x{board_size[1]}"
+                })
+            return
+    
+        if opponent and opponent.status == "waiting":
+            elo_diff = abs(self.elo - opponent.elo)
+    
+            if elo_diff > MAX_ELO_DIFFERENCE:
+                self.Send({
+                    "action": "invite_error", 
+                    "message": f"ELO difference too large ({elo_diff} > 300)"
+                    })
+                return
+        
+            if HIGH_ELO_DIFFERENCE <= elo_diff <= MAX_ELO_DIFFERENCE and self.elo > opponent.elo:
+                # Send invitation that can be declined
+                opponent.pending_invitation = {
+                    "from": self.nickname,
+                    "from_elo": self.elo,
+                    "elo_diff": elo_diff,
+                    "board_size": board_size
+                    }
+                opponent.Send({
+                    "action": "invite_request",
+                    "from": self.nickname,
+                    "from_elo": self.elo,
+                    "elo_diff": elo_diff,
+                    "forced": False,  # Player can decline
+                    "columns": board_size[0],
+                    "rows": board_size[1]
+                    })
+                return
+        
+            # If ELO difference < 200 or inviting player has lower ELO, match is forced
+            opponent.pending_invitation = {
+                "from": self.nickname,
+                "from_elo": self.elo,
+                "elo_diff": elo_diff,
+                "board_size": board_size
+                }
+            opponent.Send({
+                "action": "invite_request", 
+                "from": self.nickname,
+                "from_elo": self.elo,
+                "elo_diff": elo_diff,
+                "forced": True,  # Player must accept
+                "columns": board_size[0],
+                "rows": board_size[1]
+                })
+            
+    def Network_ovals(self, data: Dict[str, List[Tuple[int, int]]]) -> None:
+        """"To check and place a sausage
+        
+        Args:
+            data (dict): Must contain 'ovals' key with list of points,
+                or 'sausage' with a sausage id of the board"""
+        
+        if self.relay_node is not None:
+            self._server.cluster.relay(self, data)
+            return
+        
+        if self.status == "playing" and self.opponent:
+            if "sausage" in data:
+                points = self._server.SausagePoints(self.game_id, data["sausage"])
+            else:
+                points = as_points(data.get("ovals"))
+                if points is None:
+                    self.Send({"action": "invalid_move", "message": "Invalid position on the board"})
+                    return
+
+            if len(points) != 3 or len(set(points)) != 3:
+                self.Send({"action": "invalid_move", 
+                           "message": "You must select exactly 3 different points"
+                           })
+                return
+
+            table = self._server.games[self.game_id].table
+            for x, y in points:
+                if x < 0 or x >= table.width or y < 0 or y >= table.height or (x + y) % 2 != 0:
+                    self.Send({"action": "invalid_move", "message": "Invalid position on the board"})
+                    return
+            
+            if isinstance(self._server.games[self.game_id], RemoteGame):
+                # Checked against the board and played by the worker owning the game, see ShardResult()
+                self._server.shards.play(self._server.games[self.game_id], self, points)
+                return
+            
+            if not self._server.ValidateSausage(points, self.game_id):
+                self.Send({"action": "invalid_move", "message": "Invalid sausage"})
+                return
+            
+            # Update game state
+            game = self._server.games[self.game_id]
+            sausage_id = game.table.sausage_id(points)
+            game.play(sausage_id)
+            
+            # Notify players and switch turns
+            self._server.SendMove(self, self.opponent, points, sausage_id, game.remaining_moves)
+            
+            self._server.check_end_game(self.game_id, self)
+
+    def Network_invite_response(self, data: Dict[str, bool]) -> None:
+        """"Response to an invitation
+        
+        Args : True or False"""
+        
+        if self.pending_invitation and self.status == "waiting":
+            opponent = self._server.FindPlayer(self.pending_invitation["from"])
+            if opponent and opponent.status == "waiting":
+                if data["accept"]:
+                    self._start_game_with(opponent, self.pending_invitation["board_size"])
+                else:
+                    opponent.Send({
+                        "action": "invite_rejected",
+                        "message": f"{self.nickname} declined your invitation"
+                        })
+        self.pending_invitation = None
+
+           
+    def _start_game_with(self, opponent: 'Player', board_size: Optional[Tuple[int, int]] = None) -> None:
+        """"To begin a new game
+        
+        Args:
+            opponent (Player): The other player
+            board_size (tuple): (columns, rows) of the board, server default if None"""
+        columns, rows = board_size or self._server.board_size
+        self._server.matchmaking.remove(self)
+        self._server.matchmaking.remove(opponent)
+        self.status = opponent.status = "playing"
+        self.pending_invitation = opponent.pending_invitation = None
+        self.opponent = opponent
+        opponent.opponent = self
+        self.game_id = opponent.game_id = self._server.CreateGame(self, opponent, columns, rows)
+        self._server.UpdateLobby(self, opponent)
+        
+        # Random choice of the first player
+        starter = choice([self, opponent])
+        self.Send({
+            "action": "start_game",
+            "opponent": opponent.nickname,
+            "opponent_elo": opponent.elo,
+            "your_turn": starter == self,
+            "columns": columns,
+            "rows": rows
+        })
+        opponent.Send({
+            "action": "start_game",
+            "opponent": self.nickname,
+            "opponent_elo": self.elo,
+            "your_turn": starter == opponent,
+            "columns": columns,
+            "rows": rows
+        })
+    
+    def Network_game_over(self, data: Dict[str, str]) -> None:
+        """To notify the end of the game
+        
+        Args:
+            data (dict): Must contain 'winner' key with nickname
+        """
+        if self.relay_node is not None:
+            self._server.cluster.relay(self, data)
+            return
+        
+        if self.status == "playing" and self.opponent:
+            # The ELOs are settled by EndGame() only, like for the games ended by the server
+            self._server.EndGame(self.game_id, data["winner"])
+    
+    def Network_player_quit(self, data: Dict[str, Any]) -> None:
+        """To notify if someone quits or disconnects form the board"""
+        if self.relay_node is not None:
+            self._server.cluster.relay(self, data)
+            return
+        
+        if self.status == "playing" and self.opponent:
+            self.opponent.Send({"action": "opponent_disconnected"})
+            self._server.EndGame(self.game_id, self.opponent.nickname)
+        
+        self._server.matchmaking.remove(self)
+        self.status = "waiting"
+        self.opponent = None
+        self.game_id = None
+        self._server.UpdateLobby(self)
+    
+    def Network_queue_join(self, data: Dict[str, Any]) -> None:
+        """To be matched automatically with a player of close ELO
+        
+        Args:
+            data (dict): Optionally the 'columns' and 'rows' of the board to play on"""
+        board_size = (data.get("columns", self._server.board_size[0]),
+                      data.get("rows", self._server.board_size[1]))
+        if board_size not in BOARD_SIZES:
+            self.Send({
+                "action": "queue_error",
+                "message": f"Unknown board size {board_size[0]}x{board_size[1]}"
+                })
+            return
+        if self.status == "playing":
+            self.Send({"action": "queue_error", "message": "You are already playing"})
+            return
+        self._server.Enqueue(self, board_size)
+    
+    def Network_queue_leave(self, data: Dict[str, Any]) -> None:
+        """To leave the matchmaking queue and go back to the lobby"""
+        if self.status == "queued":
+            self._server.Dequeue(self)
+    
+    def Network_wire_format(self, data: Dict[str, Any]) -> None:
+        """To choose the encoding of the messages sent to this client
+        
+        Args:
+            data (dict): 'format' is "binary" for the frames of wire.py,
+                or "dict" for rencoded dicts only (the default)"""
+        self.binary_wire = data["format"] == "binary"
+        self.Send({"action": "wire_format", "format": "binary" if self.binary_wire else "dict"})
+    
+    def Network_lobby_resync(self, data: Dict[str, Any]) -> None:
+        """To get a full lobby snapshot again, when a delta was missed.
+        A client that did not choose its lobby mode gets the full lobby."""
+        if self.lobby_mode == "window":
+            self._server.SendLobbyPage(self)
+        else:
+            self._server.SubscribeLobby(self, "full")
+    
+    def Network_lobby_subscribe(self, data: Dict[str, Any]) -> None:
+        """To choose how the lobby is received, nothing of it is sent before
+        
+        Args:
+            data (dict): 'mode' is "full" for the whole waiting list and deltas,
+                or "window" for pages of the players within MAX_ELO_DIFFERENCE
+                plus the podium; optional 'page_size' in window mode"""
+        self._server.SubscribeLobby(self, data.get("mode", "full"), data.get("page_size", LOBBY_PAGE_SIZE))
+    
+    def Network_leaderboard_rank(self, data: Dict[str, Any]) -> None:
+        """To get the global rank of a player
+        
+        Args:
+            data (dict): Optional 'nickname', this player's by default"""
+        nickname = data.get("nickname", self.nickname)
+        leaderboard = self._server.leaderboard
+        self.Send({
+            "action": "leaderboard_rank",
+            "nickname": nickname,
+            "rank": leaderboard.rank(nickname) + 1 if nickname in leaderboard else None,
+            "elo": leaderboard.get(nickname)
+            })
+    
+    def Network_leaderboard_top(self, data: Dict[str, Any]) -> None:
+        """To get the best players of the leaderboard
+        
+        Args:
+            data (dict): Optional 'count' of players, PODIUM_SIZE by default"""
+        count = max(0, min(MAX_LEADERBOARD_ENTRIES, int(data.get("count", PODIUM_SIZE))))
+        self.Send({"action": "leaderboard_top", "players": self._server.leaderboard.top(count)})
+    
+    def Network_leaderboard_around(self, data: Dict[str, Any]) -> None:
+        """To get the players ranked around a rank or a player
+        
+        Args:
+            data (dict): 'rank' (starting at 1) or 'nickname', this player's
+                by default, and an optional 'radius' in ranks"""
+        leaderboard = self._server.leaderboard
+        radius = max(0, min(MAX_LEADERBOARD_ENTRIES // 2, int(data.get("radius", PODIUM_SIZE))))
+        if "rank" in data:
+            rank = max(0, int(data["rank"]) - 1)
+        else:
+            nickname = data.get("nickname", self.nickname)
+            rank = leaderboard.rank(nickname) if nickname in leaderboard else None
+        self.Send({
+            "action": "leaderboard_around",
+            "rank": None if rank is None else rank + 1,
+            "players": [] if rank is None else leaderboard.around(rank, radius)
+            })
+    
+    def Network_lobby_page(self, data: Dict[str, Any]) -> None:
+        """To get another page of a windowed lobby
+        
+        Args:
+            data (dict): 'page' number, starting at 0"""
+        if self.lobby_mode == "window":
+            self.lobby_page = max(0, int(data["page"]))
+            self._server.SendLobbyPage(self)
+
+
+class GameServer:
+    """Lobby and game management, whatever the transport.
+    
+    A transport mixes this class into its server type, calls
+    init_server() once its sockets are set up and LoadLeaderboard() once
+    its loop runs the timers."""
+    
+    def init_server(self, board_size: Tuple[int, int] = (BOARD_WIDTH, BOARD_HEIGHT),
+                    shards: int = 0, ratings: Optional[str] = RATINGS_PATH) -> None:
+        """Args:
+            board_size (tuple): Default (columns, rows) of new games
+            shards (int): Number of worker processes playing the games,
+                0 to play them in this process
+            ratings (str): SQLite database keeping the ELO of the players,
+                None to forget them when they disconnect"""
+        self.board_size = board_size # Default (columns, rows) of new games
+        self.players = PlayerRegistry() # Connected players
+        self.games = {} # Dic of the active games, by game ID
+        self.game_ids = GameIdAllocator()
+        self.timers = [] # Heap of (deadline, sequence, callback)
+        self._timer_sequence = count()
+        self._player_ids = count(1)
+        self.lobby_version = 0 # Incremented on every lobby_delta
+        self.lobby_view = EloIndex() # What the clients see: player ID -> (nickname, ELO)
+        self.lobby_changes = set() # Players to check at the next flush
+        self.window_subscribers = EloIndex() # Players in "window" mode, by their own ELO
+        self._lobby_flush_pending = False
+        self.matchmaking = MatchQueue(MAX_ELO_DIFFERENCE)
+        self._matchmaking_pending = False
+        # Transports watch self.shards.connections and call self.shards.receive()
+        self.shards = ShardPool(shards, self.ShardResult, elo_points, self.ShardLost) if shards else None
+        self.remote_games = {} # Games played by the workers, by RemoteGame key
+        self.cluster = None # Set by cluster.ClusterNode to share the lobby with other nodes
+        self.ratings = RatingStore(ratings) if ratings else None
+        self.rating = RatingEngine(elo_points, self.ratings) # Logs the results in the rating store
+        # Every player with a nickname: connected here or on another node, or only stored
+        self.leaderboard = Leaderboard()
+        self.leaderboard_top = [] # Podium of the leaderboard last sent to the lobby
+        self.ranked_names = {} # Player ID -> nickname it is ranked under
+        self.backlogged = set() # Players whose send queue is over SEND_QUEUE_LIMIT
+        self._backlog_check_pending = False
+        self.metrics = None # Set by EnableMetrics()
+        self.profiler = None # While a profile runs, see StartProfile()
+    
+    def EnableMetrics(self) -> Metrics:
+        """Start timing the handlers and counting the work of the server"""
+        if self.metrics is None:
+            self.metrics = Metrics()
+            self.metrics.gauge("sausage_games_active", "Games being played",
+                               lambda: len(self.games))
+            self.metrics.gauge("sausage_players_connected", "Players connected to this server",
+                               lambda: len(self.players))
+            self.metrics.gauge("sausage_players_waiting", "Players in the lobby, neither queued nor playing",
+                               lambda: sum(player.status == "waiting" for player in self.players))
+            self.metrics.gauge("sausage_players_queued", "Players in the matchmaking queue",
+                               lambda: len(self.matchmaking))
+            self.metrics.gauge("sausage_players_backlogged", "Players whose send queue is over the limit",
+                               lambda: len(self.backlogged))
+            self.metrics.gauge("sausage_send_queue_bytes", "Bytes queued for the clients and not sent yet",
+                               lambda: sum(player.QueuedBytes() for player in self.players))
+            self.metrics.gauge("sausage_send_queue_max_bytes", "Bytes queued for the client furthest behind",
+                               lambda: max((player.QueuedBytes() for player in self.players), default=0))
+        return self.metrics
+    
+    def StartProfile(self, window: float = PROFILE_WINDOW) -> str:
+        """Profile the main loop for `window` seconds, see profiler.SamplingProfiler.
+        
+        The profiler is dropped once the profile is written, so that the
+        handlers and the timers are back on their fast path."""
+        if self.profiler is not None:
+            return "A profile is already running"
+        profiler = self.profiler = SamplingProfiler(on_stop=self.EndProfile)
+        profiler.start(window)
+        return f"Profiling for {min(window, MAX_PROFILE_WINDOW):g}s, written to {profiler.directory}"
+    
+    def EndProfile(self) -> None:
+        self.profiler = None
+    
+    def ProfileOnSignal(self, signum: int = PROFILE_SIGNAL) -> None:
+        """Start a profile of PROFILE_WINDOW seconds when the process gets `signum`"""
+        signal.signal(signum, lambda signum, frame: self.StartProfile())
+    
+    def AdminRequest(self, path: str) -> str:
+        """Answer of the local metrics endpoint: the metrics, for
+        /profile?seconds=N the start of a profile, or for /queues the send
+        queue of each client"""
+        url = urlsplit(path)
+        if url.path == "/queues":
+            # "player_id nickname queued_bytes dropped_messages", furthest behind first
+            stats = sorted(self.SendQueueStats().items(), key=lambda item: -item[1]["queued_bytes"])
+            return "".join(f"{player_id} {self.players.by_id[player_id].nickname} "
+                           f"{queue['queued_bytes']} {queue['dropped_messages']}\n"
+                           for player_id, queue in stats)
+        if url.path == "/profile":
+            seconds = parse_qs(url.query).get("seconds", [PROFILE_WINDOW])[0]
+            try:
+                window = float(seconds)
+            except ValueError:
+                window = 0.0
+            if not 0 < window <= MAX_PROFILE_WINDOW:
+                return f"The profile must last between 0 and {MAX_PROFILE_WINDOW:g} seconds\n"
+            return self.StartProfile(window) + "\n"
+        return self.metrics.render()
+    
+    def Connected(self, channel: Player, addr: Tuple[str, int]) -> None:
+        """Called if a new player connects"""
+        self.AddPlayer(channel)
+    
+    def AddPlayer(self, player: Player) -> None:
+        """Add new player to the server.
+        
+        Args:
+            player (Player): The player to add
+        """
+        print(f"New Player connected: {player.nickname}")
+        player.player_id = next(self._player_ids)
+        player.connected = True
+        self.players.add(player)
+        self.UpdateLobby(player) # The client gets the lobby once it sends lobby_subscribe, or after a delay
+        self.CallLater(LOBBY_SUBSCRIBE_DELAY, partial(self.DefaultLobby, player))
+    
+    def DefaultLobby(self, player: Player) -> None:
+        """Subscribe a client that did not choose its lobby mode to the full
+        lobby: clients older than lobby_subscribe wait for it without asking"""
+        if player.connected and player.lobby_mode is None:
+            self.SubscribeLobby(player, "full")
+    
+    def DelPlayer(self, player: Player) -> None:
+        """Remove players who quits the lobby
+        
+        Args:
+            player (Player): The player to remove
+        """
+        print(f"Deleting Player {player.nickname}")
+        if player.relay_node is not None and self.cluster:
+            self.cluster.relay(player, {"action": "player_quit"})
+        if player.status == "playing" and player.opponent:
+            player.opponent.Send({"action": "opponent_disconnected"})
+            self.EndGame(player.game_id, player.opponent.nickname)
+        self.matchmaking.remove(player)
+        self.players.remove(player)
+        player.connected = False
+        self.UpdateLobby(player)
+    
+    def FindPlayer(self, nickname: str) -> Optional[Player]:
+        """"Find player nickname
+        
+        Args:
+            nickname (str): The nickname to search for
+            
+        Returns:
+            Player or None: The player if found, else None
+        """
+        player = self.players.find(nickname)
+        if player is None and self.cluster:
+            player = self.cluster.find(nickname)
+        return player
+    
+    def LoadRating(self, player: Player) -> None:
+        """Give a player the ELO stored for its nickname, INITIAL_ELO if it never played"""
+        if self.ratings is None or player.status == "playing":
+            return # The ELO of a game in progress is settled by EndGame()
+        elo = self.ratings.get(player.nickname)
+        if elo is None:
+            elo = INITIAL_ELO # A new nickname does not keep the ELO of the previous one
+        player.elo = elo
+        player.Send({"action": "rating", "elo": elo})
+    
+    def SaveRatings(self, *players: Player) -> None:
+        """Queue the ELO of players for the rating store, written behind the main loop"""
+        if self.ratings is not None:
+            for player in players:
+                if player.nickname != "anonymous":
+                    self.ratings.put(player.nickname, player.elo)
+    
+    def RankPlayer(self, player: Player) -> None:
+        """Keep the leaderboard entry of a player in line with its nickname and ELO.
+        
+        A player who never finished a game is forgotten when it disconnects
+        or changes its nickname, the others stay ranked with their stored ELO."""
+        ranked = self.ranked_names.get(player.player_id)
+        if ranked is not None and (ranked != player.nickname or not player.connected):
+            del self.ranked_names[player.player_id]
+            if self.ratings is None or self.ratings.get(ranked) is None:
+                self.leaderboard.remove(ranked)
+        if player.connected and player.nickname != "anonymous":
+            self.leaderboard.set(player.nickname, player.elo)
+            self.ranked_names[player.player_id] = player.nickname
+    
+    def LoadLeaderboard(self, after: str = "") -> None:
+        """Add the stored ratings to the leaderboard, LEADERBOARD_LOAD_BATCH
+        of them per tick from the first nickname after `after`.
+        
+        The server takes players from the start instead of reading the whole
+        table first: until the last batch, the ranks only count the players
+        loaded so far, and the ones who connected or played."""
+        if self.ratings is None:
+            return
+        batch = self.ratings.ratings(after, LEADERBOARD_LOAD_BATCH)
+        self.leaderboard.load(batch)
+        if len(batch) == LEADERBOARD_LOAD_BATCH:
+            self.CallLater(0, partial(self.LoadLeaderboard, batch[-1][0]))
+        else:
+            print(f"Leaderboard loaded: {len(self.leaderboard)} players")
+        if not self._lobby_flush_pending: # For the podium
+            self._lobby_flush_pending = True
+            self.CallLater(0, self.FlushLobby)
+    
+    def RankEntries(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Set the global rank of lobby entries, dropping it for the unranked players"""
+        for entry in entries:
+            if entry["name"] in self.leaderboard:
+                entry["rank"] = self.leaderboard.rank(entry["name"]) + 1
+            else:
+                entry.pop("rank", None)
+        return entries
+    
+    def UpdateLobby(self, *players: Player) -> None:
+        """Schedule a lobby update for the end of the current tick.
+        
+        All the changes of a tick are sent as a single lobby_delta.
+        
+        Args:
+            players (Player): The players whose lobby entry may have changed,
+                every player if none is given
+        """
+        self.lobby_changes.update(players or self.players)
+        if not self._lobby_flush_pending:
+            self._lobby_flush_pending = True
+            self.CallLater(0, self.FlushLobby)
+    
+    def FlushLobby(self) -> None:
+        """Send the lobby changes since the last flush to all clients"""
+        self._lobby_flush_pending = False
+        changed, self.lobby_changes = self.lobby_changes, set()
+        podium = self.lobby_view.ranked(0, PODIUM_SIZE)
+        
+        joined, updated, left = [], [], []
+        touched = [] # Keys (-elo, player_id) set or removed in the lobby view
+        refresh = set() # Windowed subscribers that need a new page
+        if self.cluster:
+            local = [player for player in changed if player.home_node is None]
+            if local:
+                self.cluster.publish_presence(local)
+        
+        for player in changed:
+            self.RankPlayer(player)
+            entry = (player.nickname, player.elo)
+            seen = self.lobby_view.get(player.player_id)
+            if player.connected and player.status == "waiting":
+                if seen is None:
+                    joined.append({"id": player.player_id, "name": entry[0], "elo": entry[1]})
+                    touched.append((-player.elo, player.player_id))
+                elif seen != entry:
+                    updated.append({"id": player.player_id, "name": entry[0], "elo": entry[1]})
+                    touched.extend(((-seen[1], player.player_id), (-player.elo, player.player_id)))
+                self.lobby_view.set(player.player_id, *entry)
+            elif seen is not None:
+                left.append(player.player_id)
+                touched.append((-seen[1], player.player_id))
+                self.lobby_view.remove(player.player_id)
+            
+            # The window of a subscriber follows its own ELO
+            subscribed = self.window_subscribers.get(player.player_id)
+            if not player.connected or player.lobby_mode != "window":
+                if subscribed is not None:
+                    self.window_subscribers.remove(player.player_id)
+            elif subscribed is None or subscribed[1] != player.elo:
+                self.window_subscribers.set(player.player_id, *entry)
+                refresh.add(player)
+        
+        if joined or updated or left:
+            self.lobby_version += 1
+            # Encoded once per wire format, the same bytes are queued on every channel
+            delta = {
+                "action": "lobby_delta",
+                "version": self.lobby_version,
+                "join": self.RankEntries(joined),
+                "update": self.RankEntries(updated),
+                "leave": left
+            }
+            payload = encode_message(delta)
+            frame = None
+            for p in self.players:
+                if p.lobby_mode == "full":
+                    if p.binary_wire:
+                        if frame is None:
+                            frame = encode(delta, binary=True)
+                        self.SendLobbyMessage(p, frame, "lobby_delta")
+                    else:
+                        self.SendLobbyMessage(p, payload, "lobby_delta")
+            
+            # A page changes when an entry sorted before its end changes, or
+            # when the number of pages of its window does
+            page_ends = {} # Subscriber ID -> key after its page, None if its page count changed
+            for key in touched:
+                elo = -key[0]
+                for player_id in self.window_subscribers.ids_between(elo - MAX_ELO_DIFFERENCE,
+                                                                     elo + MAX_ELO_DIFFERENCE):
+                    if player_id not in page_ends:
+                        page_ends[player_id] = self.LobbyPageEnd(self.players.by_id[player_id])
+                    end = page_ends[player_id]
+                    if end is None or key < end:
+                        refresh.add(self.players.by_id[player_id])
+            
+            new_podium = self.lobby_view.ranked(0, PODIUM_SIZE)
+            if new_podium != podium:
+                payload = encode_message({"action": "lobby_podium", "podium": self.RankEntries(new_podium)})
+                for player_id in self.window_subscribers.entries:
+                    self.SendLobbyMessage(self.players.by_id[player_id], payload, "lobby_podium")
+        
+        pages = {} # Encoded once for the subscribers that see the same page
+        for player in refresh:
+            self.SendLobbyPage(player, pages)
+        
+        new_top = self.leaderboard.top(PODIUM_SIZE)
+        if new_top != self.leaderboard_top:
+            self.leaderboard_top = new_top
+            payload = encode_message({"action": "leaderboard_top", "players": new_top})
+            for player in self.players:
+                if player.lobby_mode is not None:
+                    self.SendLobbyMessage(player, payload, "leaderboard_top")
+    
+    def SubscribeLobby(self, player: Player, mode: str, page_size: int = LOBBY_PAGE_SIZE) -> None:
+        """Switch a player between the full lobby and its ELO window.
+        
+        Args:
+            player (Player): The subscribing player
+            mode (str): "full" or "window"
+            page_size (int): Players per page in "window" mode
+        """
+        if mode == "window":
+            player.lobby_mode = "window"
+            player.lobby_page = 0
+            player.lobby_page_size = max(1, min(MAX_LOBBY_PAGE_SIZE, int(page_size)))
+            self.window_subscribers.set(player.player_id, player.nickname, player.elo)
+            self.SendLobbyPage(player)
+        else:
+            player.lobby_mode = "full"
+            if player.player_id in self.window_subscribers:
+                self.window_subscribers.remove(player.player_id)
+            self.SendLobbySnapshot(player)
+    
+    def LobbyPageEnd(self, player: Player) -> Optional[Tuple[int, float]]:
+        """Key (-elo, player_id) after the last entry of the lobby page a
+        subscriber was sent, None if its number of pages changed since"""
+        size = player.lobby_page_size
+        total, end = self.lobby_view.page_end(player.elo - MAX_ELO_DIFFERENCE, player.elo + MAX_ELO_DIFFERENCE,
+                                              player.lobby_page * size, size)
+        return end if max(1, -(-total // size)) == player.lobby_pages else None
+    
+    def SendLobbyPage(self, player: Player, pages: Optional[Dict[Tuple[int, ...], Tuple[int, bytes]]] = None) -> None:
+        """Send one page of the waiting players within a player's ELO window, and the podium
+        
+        Args:
+            pages (dict): Pages already encoded, by ELO, page, page size
+                and wire format, to share them between the subscribers
+                refreshed by a lobby flush"""
+        key = (player.elo, player.lobby_page, player.lobby_page_size, player.binary_wire)
+        page = pages.get(key) if pages is not None else None
+        if page is None:
+            elo_min = player.elo - MAX_ELO_DIFFERENCE
+            elo_max = player.elo + MAX_ELO_DIFFERENCE
+            size = player.lobby_page_size
+            total, players = self.lobby_view.window(elo_min, elo_max, player.lobby_page * size, size)
+            count = max(1, -(-total // size))
+            page = (count, encode({
+                "action": "lobby_page",
+                "version": self.lobby_version,
+                "elo_min": elo_min,
+                "elo_max": elo_max,
+                "page": player.lobby_page,
+                "pages": count,
+                "total": total,
+                "players": self.RankEntries(players),
+                "podium": self.RankEntries(self.lobby_view.ranked(0, PODIUM_SIZE))
+            }, player.binary_wire))
+            if pages is not None:
+                pages[key] = page
+        player.lobby_pages = page[0]
+        self.SendLobbyMessage(player, page[1], "lobby_page")
+    
+    def SendLobbySnapshot(self, player: Player) -> None:
+        """Send the whole lobby to one client, as seen at the current version"""
+        self.SendLobbyMessage(player, encode({
+            "action": "lobby_update",
+            "version": self.lobby_version,
+            "players": self.RankEntries(self.lobby_view.ranked()) # Sorted by ELO (highest first)
+        }, player.binary_wire), "lobby_update")
+    
+    def SendLobbyMessage(self, player: Player, payload: bytes, action: str) -> None:
+        """Queue an encoded lobby message, unless the client is too far behind.
+        
+        Lobby messages and the leaderboard podium are the only ones that
+        keep coming to an idle client, and each snapshot supersedes the
+        previous ones: when the send queue of a client is over
+        SEND_QUEUE_LIMIT, they are dropped until it drains, and
+        CheckBacklogs() then sends a single fresh snapshot and podium.
+        
+        Args:
+            action (str): Type of the message, for the metrics"""
+        if not player.lobby_stale and player.QueuedBytes() <= SEND_QUEUE_LIMIT:
+            player.SendEncoded(payload, action)
+            return
+        player.dropped_messages += 1
+        if self.metrics is not None:
+            self.metrics.lobby_dropped += 1
+        if not player.lobby_stale:
+            player.lobby_stale = True
+            if player.backlogged_since is None:
+                player.backlogged_since = monotonic()
+            self.backlogged.add(player)
+            if not self._backlog_check_pending:
+                self._backlog_check_pending = True
+                self.CallLater(BACKLOG_CHECK_INTERVAL, self.CheckBacklogs)
+    
+    def CheckBacklogs(self) -> None:
+        """Catch up the clients whose send queue drained, and disconnect the
+        ones over SEND_QUEUE_LIMIT for more than SEND_QUEUE_TIMEOUT.
+        
+        Runs every BACKLOG_CHECK_INTERVAL seconds while some clients are behind."""
+        self._backlog_check_pending = False
+        now = monotonic()
+        for player in list(self.backlogged):
+            if not player.connected:
+                self.backlogged.discard(player)
+            elif player.QueuedBytes() <= SEND_QUEUE_LIMIT:
+                self.backlogged.discard(player)
+                player.backlogged_since = None
+                player.lobby_stale = False
+                if player.lobby_mode == "window":
+                    self.SendLobbyPage(player)
+                elif player.lobby_mode == "full":
+                    self.SendLobbySnapshot(player)
+                if player.lobby_mode is not None: # The podium of the leaderboard may have been dropped too
+                    player.Send({"action": "leaderboard_top", "players": self.leaderboard.top(PODIUM_SIZE)})
+            elif now - player.backlogged_since > SEND_QUEUE_TIMEOUT:
+                print(f"Disconnecting {player.nickname}: {player.QueuedBytes()} bytes waiting "
+                      f"for more than {SEND_QUEUE_TIMEOUT}s")
+                self.backlogged.discard(player)
+                if self.metrics is not None:
+                    self.metrics.slow_disconnects += 1
+                player.Disconnect()
+        if self.backlogged:
+            self._backlog_check_pending = True
+            self.CallLater(BACKLOG_CHECK_INTERVAL, self.CheckBacklogs)
+    
+    def SendQueueStats(self) -> Dict[int, Dict[str, int]]:
+        """Bytes waiting to be sent and lobby messages dropped, by player ID"""
+        return {player.player_id: {"queued_bytes": player.QueuedBytes(),
+                                   "dropped_messages": player.dropped_messages}
+                for player in self.players}
+    
+    def Enqueue(self, player: Player, board_size: Tuple[int, int]) -> None:
+        """Put a player in the matchmaking queue, out of the lobby list"""
+        self.matchmaking.add(player, board_size)
+        player.status = "queued"
+        player.pending_invitation = None
+        player.Send({
+            "action": "queue_joined",
+            "queued": len(self.matchmaking),
+            "median_wait": self.matchmaking.median_wait()
+            })
+        self.UpdateLobby(player)
+        if not self._matchmaking_pending:
+            self._matchmaking_pending = True
+            self.CallLater(MATCHMAKING_INTERVAL, self.MatchPlayers)
+    
+    def Dequeue(self, player: Player) -> None:
+        """Take a player out of the matchmaking queue, back to the lobby"""
+        self.matchmaking.remove(player)
+        player.status = "waiting"
+        player.Send({"action": "queue_left"})
+        self.UpdateLobby(player)
+    
+    def MatchPlayers(self) -> None:
+        """Start a game for every pair found in the matchmaking queue.
+        
+        Runs every MATCHMAKING_INTERVAL seconds while players are queued."""
+        self._matchmaking_pending = False
+        for player, opponent, board_size in self.matchmaking.pair():
+            player._start_game_with(opponent, board_size)
+        if self.matchmaking:
+            self._matchmaking_pending = True
+            self.CallLater(MATCHMAKING_INTERVAL, self.MatchPlayers)
+    
+    def CreateGame(self, player1: Player, player2: Player, columns: int, rows: int) -> int:
+        """Register a new game, played here or by a worker, and return its ID"""
+        game_id = self.game_ids.acquire()
+        game = self.shards.start(game_id, player1, player2, columns, rows) if self.shards else None
+        if game is not None:
+            self.remote_games[game.key] = game
+        else: # No worker, or none left
+            game = Game(game_id, player1, player2, get_table(columns, rows))
+        self.games[game_id] = game
+        return game_id
+    
+    def ShardResult(self, message: Tuple[Any, ...]) -> None:
+        """Handle the result of a move played by a worker"""
+        _, key, slot, points, error, remaining_moves, points_won = message
+        game = self.remote_games.get(key)
+        if game is None:
+            return # Ended while the move was checked
+        player, opponent = (game.player1, game.player2) if slot == 1 else (game.player2, game.player1)
+        if self.metrics is not None:
+            # The worker tested the sausage and, if it was legal, the end of the game
+            self.metrics.candidates_tested += 1
+            self.metrics.end_game_scans += not error
+        if error:
+            player.Send({"action": "invalid_move", "message": error})
+            return
+        
+        self.SendMove(player, opponent, points, game.table.sausage_id(points), remaining_moves)
+        
+        if points_won is not None:
+            self.EndGame(game.game_id, player.nickname, points_won)
+    
+    def SausagePoints(self, game_id: int, sausage_id: int) -> Tuple[Tuple[int, int], ...]:
+        """Points of a sausage id of a game's board, () if there is no such id"""
+        sausages = self.games[game_id].table.sausages
+        if type(sausage_id) is not int:
+            return ()
+        return sausages[sausage_id] if 0 <= sausage_id < len(sausages) else ()
+    
+    def SendMove(self, player: Player, opponent: Player, points: List[Tuple[int, int]],
+                 sausage_id: int, remaining_moves: int) -> None:
+        """Tell both players about a placed sausage and that the turn changed.
+        
+        A client with binary frames gets one MOVE frame instead of the
+        valid_move or ovals message followed by turn_update."""
+        if player.binary_wire:
+            player.SendEncoded(move_frame(sausage_id, remaining_moves, own_move=True), "move")
+        else:
+            player.Send({"action": "valid_move", "ovals": points})
+            player.Send({"action": "turn_update", "your_turn": False, "remaining_moves": remaining_moves})
+        if opponent.binary_wire:
+            opponent.SendEncoded(move_frame(sausage_id, remaining_moves, own_move=False), "move")
+        else:
+            opponent.Send({"action": "ovals", "ovals": points})
+            opponent.Send({"action": "turn_update", "your_turn": True, "remaining_moves": remaining_moves})
+    
+    def ValidateSausage(self, points: List[Tuple[int, int]], game_id: int) -> bool:
+        """Validate if sausage placement is legal.
+       
+       Args:
+           points (list): List of (x,y) tuples
+           game_id (int): The game ID
+           
+       Returns:
+           bool: True or False
+       """
+        if self.metrics is not None:
+            self.metrics.candidates_tested += 1
+        
+        # Number of points selected
+        if len(points) != 3 or len(set(points)) != 3:
+            return False
+        
+        game = self.games.get(game_id)
+        table = game.table if game else DEFAULT_TABLE
+        
+        # If the points are on the grid
+        for x, y in points:
+            if (not (0 <= x < table.width) or 
+                not (0 <= y < table.height) or 
+                (x + y) % 2 != 0):
+                return False
+    
+        # Check the distance rule (<=2 in row and <=2 in columns)
+        sausage_id = table.sausage_id(points)
+        if sausage_id < 0:
+            return False
+            
+        # Check sausage crossing against the placed ones
+        if game:
+            return game.is_legal(sausage_id)
+    
+        return True
+    
+
+    def ValidateSausageSimulated(self, points: List[Tuple[int, int]], game: Game) -> bool:
+        """Validation without sending messages (for end game check)
+        
+        Args and returns : same as the previous function : ValidateSausage()"""
+        if self.metrics is not None:
+            self.metrics.candidates_tested += 1
+        return game.is_legal(game.table.sausage_id(points))
+    
+
+    def CheckCrossing(self, sausage1: List[Tuple[int, int]], sausage2: List[Tuple[int, int]]) -> bool:
+        """Check if two sausages intersect.
+        
+        Args:
+            sausage1 (list): First sausage points
+            sausage2 (list): Second sausage points
+            
+        Returns:
+            bool: True or False
+        """
+        return sausages_cross(sausage1, sausage2)
+
+    def segments_intersect(self, p1: Tuple[int, int], p2: Tuple[int, int], p3: Tuple[int, int], p4: Tuple[int, int]) -> bool:
+        """Check if two line segments intersect"""
+        return segments_intersect(p1, p2, p3, p4)
+    
+    def check_end_game(self, game_id: int, last_player: Player) -> None:
+        """Check if game should end (no possible moves left).
+        
+        Args:
+            game_id (int): The game identifier
+            last_player (Player): The player who made last move
+        """
+        game = self.games.get(game_id)
+        if not game:
+            return
+        if self.metrics is not None:
+            self.metrics.end_game_scans += 1
+        
+        # The set of playable sausages is kept up to date on every move
+        if game.remaining:
+            return  # At least one valid move remains
+        
+        # No valid moves left - end game
+        self.EndGame(game_id, winner=last_player.nickname)
+    
+    def EndGame(self, game_id: int, winner: str, points: Optional[int] = None) -> None:
+        """Clean up after game ends and update ELOs.
+        
+        Args:
+            game_id (int): The game identifier
+            winner (str): Nickname of the winning player
+            points (int): ELO points won, already computed by a worker
+        """
+        if game_id in self.games:
+            game = self.games[game_id]
+            player1 = game.player1
+            player2 = game.player2
+            winning, losing = (player1, player2) if winner == player1.nickname else (player2, player1)
+            winner_elo, loser_elo = game.initial_elos if winning is player1 else game.initial_elos[::-1]
+            result = self.rating.settle(winning, losing, winner_elo, loser_elo, points)
+            self.SaveRatings(player1, player2)
+
+            # Send ELO updates
+            for player in (player1, player2):
+                player.Send({
+                    "action": "elo_update",
+                    "new_elo": player.elo,
+                    "elo_change": (result.points if player is winning else -result.points)
+                    })
+
+            # Announce winner
+            player1.Send({"action": "game_over", "winner": winner})
+            player2.Send({"action": "game_over", "winner": winner})
+
+            self.CloseGame(game)
+    
+    def CloseGame(self, game: Union[Game, RemoteGame]) -> None:
+        """Forget a game and send its players back to the lobby"""
+        player1 = game.player1
+        player2 = game.player2
+        player1.status = "waiting"
+        player2.status = "waiting"
+        player1.opponent = None
+        player2.opponent = None
+        player1.game_id = None
+        player2.game_id = None
+        del self.games[game.game_id]
+        self.game_ids.release(game.game_id)
+        if isinstance(game, RemoteGame):
+            del self.remote_games[game.key]
+            self.shards.drop(game)
+
+        self.UpdateLobby(player1, player2)
+    
+    def ShardLost(self, shard: int) -> None:
+        """A worker died: its games end without a winner nor ELO change"""
+        print(f"Worker {shard} is gone, ending its games")
+        for game in [game for game in self.remote_games.values() if game.shard == shard]:
+            if game.key in self.remote_games: # Not ended meanwhile
+                game.player1.Send({"action": "opponent_disconnected"})
+                game.player2.Send({"action": "opponent_disconnected"})
+                self.CloseGame(game)
+    
+    def CallLater(self, delay: float, callback: Callable[[], None]) -> None:
+        """Run a callback from the main loop after `delay` seconds"""
+        if self.profiler is not None:
+            callback = self.profiler.deferred(callback)
+        heappush(self.timers, (monotonic() + delay, next(self._timer_sequence), callback))
+    
+    def RunTimers(self) -> None:
+        """Run the callbacks whose deadline has passed"""
+        now = monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            heappop(self.timers)[2]()
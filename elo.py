@@ -0,0 +1,150 @@
+from typing import List, Tuple, Dict, Optional, Any, Iterable, Callable
+
+import sys
+from time import time, perf_counter
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional, only needed by recompute()
+    np = None
+
+
+INITIAL_ELO = 1000
+MAX_ELO_DIFFERENCE = 300
+HIGH_ELO_DIFFERENCE = 200
+BASE_ELO_POINTS = 100
+
+# Largest ELO recompute() keeps in int64: the difference of two such ELOs
+# and the points it is worth still fit in 64 bits
+INT64_ELO_LIMIT = 2 ** 61
+
+# A finished game, as kept in the game-result log: the ELOs are the ones
+# of the players when the game started, `points` what the winner took
+GameResult = namedtuple("GameResult", ("time", "winner", "loser", "winner_elo", "loser_elo", "points"))
+
+
+def elo_points(winner_elo: int, loser_elo: int) -> int:
+    """ELO points the winner takes from the loser"""
+    return BASE_ELO_POINTS + min(MAX_ELO_DIFFERENCE, winner_elo - loser_elo) // 3
+
+
+def elo_points_batch(winner_elos: "np.ndarray", loser_elos: "np.ndarray") -> "np.ndarray":
+    """elo_points() of many games at once (needs NumPy)"""
+    return BASE_ELO_POINTS + np.minimum(MAX_ELO_DIFFERENCE, winner_elos - loser_elos) // 3
+
+
+class RatingEngine:
+    """The only place where the ELO of players changes.
+
+    Every finished game becomes a GameResult: applied to the two players,
+    then appended to `log` if there is one (any object with a record()
+    method, such as a ratings.RatingStore). recompute() replays such a
+    log from scratch.
+    """
+
+    def __init__(self, rule: Callable[[int, int], int] = elo_points, log: Optional[Any] = None) -> None:
+        self.rule = rule
+        self.log = log
+
+    def settle(self, winner: Any, loser: Any, winner_elo: int, loser_elo: int,
+               points: Optional[int] = None) -> GameResult:
+        """Move the ELO points of a game from the loser to the winner.
+
+        Args:
+            winner, loser: The players, with `nickname` and `elo`
+            winner_elo, loser_elo (int): Their ELO when the game started
+            points (int): ELO points won, if already computed by a worker
+        """
+        if points is None:
+            points = self.rule(winner_elo, loser_elo)
+        result = GameResult(time(), winner.nickname, loser.nickname, winner_elo, loser_elo, points)
+        winner.elo += points
+        loser.elo -= points
+        if self.log is not None:
+            self.log.record(result)
+        return result
+
+
+def schedule(winners: "np.ndarray", losers: "np.ndarray") -> List["np.ndarray"]:
+    """Split games into rounds where nobody plays twice, keeping the order
+    of the games of each player.
+
+    Returns:
+        list: Indexes of the games of each round, in order
+    """
+    players = int(max(winners.max(), losers.max())) + 1 if len(winners) else 0
+    last = [-1] * players # Player -> last round played
+    rounds = []
+    for w, l in zip(winners.tolist(), losers.tolist()):
+        r = max(last[w], last[l]) + 1
+        last[w] = last[l] = r
+        rounds.append(r)
+    rounds = np.array(rounds, dtype=np.int64)
+    order = np.argsort(rounds, kind="stable")
+    bounds = np.flatnonzero(np.diff(rounds[order])) + 1
+    return np.split(order, bounds)
+
+
+def recompute(history: Iterable[Tuple[str, str]],
+              rule: Callable[["np.ndarray", "np.ndarray"], "np.ndarray"] = elo_points_batch,
+              initial: int = INITIAL_ELO) -> Dict[str, int]:
+    """Ratings of every player after replaying all the games with a rule (needs NumPy).
+
+    The games only depend on each other through their players, so they
+    are replayed round by round (see schedule()), each round as a few
+    array operations over all its games. The rule does not bound the
+    points, so ratings can run away: past INT64_ELO_LIMIT they are carried
+    as Python ints, to stay equal to a game-by-game replay.
+
+    Args:
+        history: (winner, loser) nicknames of each game, oldest first
+        rule: ELO points won for arrays of winner and loser ELOs
+        initial (int): ELO of a player before its first game
+
+    Returns:
+        dict: ELO by nickname
+    """
+    ids: Dict[str, int] = {}
+    winners, losers = [], []
+    for winner, loser in history:
+        winners.append(ids.setdefault(winner, len(ids)))
+        losers.append(ids.setdefault(loser, len(ids)))
+    winners = np.array(winners, dtype=np.int64)
+    losers = np.array(losers, dtype=np.int64)
+    elos = np.full(len(ids), initial, dtype=np.int64)
+    bound = abs(initial) # No ELO is further from 0
+    for games in schedule(winners, losers):
+        w, l = winners[games], losers[games]
+        points = rule(elos[w], elos[l])
+        elos[w] += points # No player twice in a round, so no lost updates
+        elos[l] -= points
+        if elos.dtype != object:
+            bound += int(np.abs(points).max(initial=0))
+            if bound > INT64_ELO_LIMIT:
+                bound = int(np.abs(elos).max())
+                if bound > INT64_ELO_LIMIT:
+                    elos = elos.astype(object)
+    return dict(zip(ids, elos.tolist()))
+
+
+if __name__ == '__main__':
+    from ratings import RatingStore
+
+    if len(sys.argv) != 2:
+        print("Please use: python3", sys.argv[0], "ratings_db")
+        print("e.g., python3", sys.argv[0], "ratings.db")
+        sys.exit(1)
+    store = RatingStore(sys.argv[1])
+    start = perf_counter()
+    history = [(game.winner, game.loser) for game in store.history()]
+    loaded = perf_counter()
+    ratings = recompute(history)
+    done = perf_counter()
+    print(f"{len(history)} games of {len(ratings)} players: "
+          f"loaded in {loaded - start:.2f}s, replayed in {done - loaded:.2f}s")
+    changed = sum(store.get(nickname) != elo for nickname, elo in ratings.items())
+    print(f"{changed} stored ratings differ from the replay")
+    for rank, (nickname, elo) in enumerate(sorted(ratings.items(), key=lambda item: -item[1])[:10], 1):
+        print(f"#{rank} {nickname} {elo}")
+    store.close()
@@ -0,0 +1,63 @@
+from typing import List, Tuple, Any
+from array import array
+
+from rules import SausageTable, DEFAULT_TABLE
+
+
+class Game:
+    """State of one game between two players.
+
+    The moves are stored as sausage ids of `table`, and the moves still
+    playable as a bitset of those ids.
+    """
+
+    __slots__ = ("game_id", "player1", "player2", "initial_elos", "table",
+                 "remaining", "moves")
+
+    def __init__(self, game_id: int, player1: Any, player2: Any,
+                 table: SausageTable = DEFAULT_TABLE) -> None:
+        self.game_id = game_id
+        self.player1 = player1
+        self.player2 = player2
+        self.initial_elos = (player1.elo, player2.elo)
+        self.table = table
+        self.remaining = table.full_mask # Bitset of the sausage ids still playable
+        self.moves = array("H") # Sausage ids, in the order they were played
+
+    def is_legal(self, sausage_id: int) -> bool:
+        """True if the sausage can be placed now"""
+        return sausage_id >= 0 and bool(self.remaining >> sausage_id & 1)
+
+    def play(self, sausage_id: int) -> None:
+        """Place a sausage, already checked with is_legal()"""
+        self.moves.append(sausage_id)
+        self.remaining = self.table.play(self.remaining, sausage_id)
+
+    @property
+    def remaining_moves(self) -> int:
+        """Number of sausages that can still be placed"""
+        return self.table.count(self.remaining)
+
+    @property
+    def sausages(self) -> List[Tuple[Tuple[int, int], ...]]:
+        """Placed sausages as lists of points"""
+        return [self.table.sausages[sausage_id] for sausage_id in self.moves]
+
+
+class GameIdAllocator:
+    """Hands out small integer game ids, reusing the ones released"""
+
+    __slots__ = ("_free", "_next")
+
+    def __init__(self) -> None:
+        self._free: List[int] = []
+        self._next = 0
+
+    def acquire(self) -> int:
+        if self._free:
+            return self._free.pop()
+        self._next += 1
+        return self._next - 1
+
+    def release(self, game_id: int) -> None:
+        self._free.append(game_id)
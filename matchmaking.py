@@ -0,0 +1,100 @@
+from typing import List, Tuple, Dict, Optional, Any
+from collections import deque
+from statistics import median
+from time import monotonic
+
+
+BUCKET_WIDTH = 50 # ELO points per bucket
+INITIAL_GAP = 50 # Largest ELO difference accepted when joining the queue
+GAP_GROWTH = 25 # ELO points added to the accepted difference per second waited
+WAIT_SAMPLES = 1000 # Queue times kept for the median
+
+
+class MatchQueue:
+    """Players waiting for an automatic match, bucketed by board size and ELO.
+
+    Every call to pair() goes through the queue, longest wait first, and
+    matches each player with the first waiting player of the nearest
+    buckets whose ELO is close enough. The accepted difference starts at
+    `initial_gap` and grows with the wait, up to `max_gap`.
+    """
+
+    def __init__(self, max_gap: int, initial_gap: int = INITIAL_GAP,
+                 gap_growth: float = GAP_GROWTH, bucket_width: int = BUCKET_WIDTH) -> None:
+        self.max_gap = max_gap
+        self.initial_gap = initial_gap
+        self.gap_growth = gap_growth
+        self.bucket_width = bucket_width
+        # Player ID -> (player, board size, ELO when queued, time queued), oldest first
+        self.queued: Dict[int, Tuple[Any, Tuple[int, int], int, float]] = {}
+        # (board size, ELO // bucket_width) -> player ID -> player, oldest first
+        self.buckets: Dict[Tuple[Tuple[int, int], int], Dict[int, Any]] = {}
+        self.waits = deque(maxlen=WAIT_SAMPLES) # Queue times of the last matched players
+
+    def __len__(self) -> int:
+        return len(self.queued)
+
+    def __contains__(self, player: Any) -> bool:
+        return player.player_id in self.queued
+
+    def add(self, player: Any, board_size: Tuple[int, int]) -> None:
+        if player.player_id in self.queued:
+            self.remove(player)
+        self.queued[player.player_id] = (player, board_size, player.elo, monotonic())
+        key = (board_size, player.elo // self.bucket_width)
+        self.buckets.setdefault(key, {})[player.player_id] = player
+
+    def remove(self, player: Any) -> None:
+        entry = self.queued.pop(player.player_id, None)
+        if entry is not None:
+            _, board_size, elo, _ = entry
+            key = (board_size, elo // self.bucket_width)
+            bucket = self.buckets[key]
+            del bucket[player.player_id]
+            if not bucket:
+                del self.buckets[key]
+
+    def gap(self, waited: float) -> int:
+        """Largest ELO difference accepted after waiting `waited` seconds"""
+        return min(self.max_gap, int(self.initial_gap + self.gap_growth * waited))
+
+    def pair(self) -> List[Tuple[Any, Any, Tuple[int, int]]]:
+        """Match the queued players that can play together.
+
+        Returns:
+            list: (player, opponent, board size) of each match, the players
+                are removed from the queue
+        """
+        now = monotonic()
+        matches = []
+        for player_id in list(self.queued):
+            entry = self.queued.get(player_id)
+            if entry is None:
+                continue # Already matched during this pass
+            player, board_size, elo, since = entry
+            gap = self.gap(now - since)
+            opponent = self._closest(player_id, board_size, elo, gap)
+            if opponent is None:
+                continue
+            self.waits.append(now - since)
+            self.waits.append(now - self.queued[opponent.player_id][3])
+            self.remove(player)
+            self.remove(opponent)
+            matches.append((player, opponent, board_size))
+        return matches
+
+    def _closest(self, player_id: int, board_size: Tuple[int, int],
+                 elo: int, gap: int) -> Optional[Any]:
+        """Oldest player of the nearest bucket within `gap` ELO points"""
+        width = self.bucket_width
+        center = elo // width
+        for distance in range(gap // width + 2):
+            for index in {center - distance, center + distance}:
+                for other_id, other in self.buckets.get((board_size, index), {}).items():
+                    if other_id != player_id and abs(self.queued[other_id][2] - elo) <= gap:
+                        return other
+        return None
+
+    def median_wait(self) -> Optional[float]:
+        """Median queue time of the last matched players, in seconds"""
+        return median(self.waits) if self.waits else None
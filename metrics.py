@@ -0,0 +1,151 @@
+from typing import List, Tuple, Dict, Optional, Callable
+
+import os
+import socket
+from bisect import bisect_left
+from time import perf_counter
+from collections import Counter
+
+
+METRICS_ENV = "SAUSAGE_METRICS" # host:port or Unix socket path of the metrics endpoint, unset to disable
+MAX_REQUEST_LINE = 4096 # Bytes of a request to the endpoint read at most
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+WRITE_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128) # Upper bounds of the messages per write buckets
+
+
+class Histogram:
+    """Counts of values by bucket, the last one for the values above every bound"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str = "") -> List[str]:
+        """Samples of the histogram in the Prometheus text format"""
+        prefix = labels + "," if labels else ""
+        lines, total = [], 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {total}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum!r}")
+        lines.append(f"{name}_count{suffix} {total}")
+        return lines
+
+
+class Metrics:
+    """What a GameServer spends its time on, in the Prometheus text format.
+
+    A server keeps metrics only once EnableMetrics() was called: until
+    then its `metrics` is None, and each instrumented place costs one
+    test of that attribute. When enabled, a handler costs two
+    perf_counter() calls and a bucket search, a message sent one Counter
+    update; the gauges are only read when the endpoint is scraped.
+    """
+
+    def __init__(self) -> None:
+        self.handlers: Dict[str, Histogram] = {} # Network_* handler latency, by action
+        self.ticks = Histogram() # Work done by a tick of the main loop, idle wait excluded
+        self.write_sizes = Histogram(WRITE_SIZE_BUCKETS) # Messages batched in each write to a client
+        self.end_game_scans = 0 # Checks for a game with no move left
+        self.candidates_tested = 0 # Sausages validated against a game
+        self.lobby_dropped = 0 # Lobby messages dropped for clients too far behind
+        self.slow_disconnects = 0 # Clients disconnected for staying over the send queue limit
+        self.sent_bytes = Counter() # Outbound bytes, by message type
+        self.sent_messages = Counter()
+        self.gauges: List[Tuple[str, str, Callable[[], float]]] = []
+        self._tick_start: Optional[float] = None
+
+    def handled(self, action: str, start: float) -> None:
+        """Record a handler that started at `start` (perf_counter()) and just returned"""
+        histogram = self.handlers.get(action)
+        if histogram is None:
+            histogram = self.handlers[action] = Histogram()
+        histogram.observe(perf_counter() - start)
+        if self._tick_start is None:
+            self._tick_start = start
+
+    def begin_tick(self) -> None:
+        """The main loop is done waiting, unless a handler already started the tick"""
+        if self._tick_start is None:
+            self._tick_start = perf_counter()
+
+    def end_tick(self) -> None:
+        """The main loop is about to wait again"""
+        if self._tick_start is not None:
+            self.ticks.observe(perf_counter() - self._tick_start)
+            self._tick_start = None
+
+    def sent(self, action: str, size: int) -> None:
+        self.sent_bytes[action] += size
+        self.sent_messages[action] += 1
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> None:
+        """Publish the value returned by `read` at each scrape"""
+        self.gauges.append((name, help, read))
+
+    def render(self) -> str:
+        lines = [
+            "# HELP sausage_handler_seconds Time spent in the Network_* handler of each action",
+            "# TYPE sausage_handler_seconds histogram"
+            ]
+        for action, histogram in sorted(self.handlers.items()):
+            lines.extend(histogram.lines("sausage_handler_seconds", f'action="{action}"'))
+        lines.append("# HELP sausage_tick_seconds Work done by a tick of the main loop, waiting excluded")
+        lines.append("# TYPE sausage_tick_seconds histogram")
+        lines.extend(self.ticks.lines("sausage_tick_seconds"))
+        lines.append("# HELP sausage_write_messages Messages sent to a client by one write")
+        lines.append("# TYPE sausage_write_messages histogram")
+        lines.extend(self.write_sizes.lines("sausage_write_messages"))
+        for name, help, value in (
+                ("sausage_end_game_scans_total", "Checks for a game with no move left", self.end_game_scans),
+                ("sausage_candidates_tested_total", "Sausages validated against a game", self.candidates_tested),
+                ("sausage_lobby_dropped_total", "Lobby messages dropped for clients too far behind",
+                 self.lobby_dropped),
+                ("sausage_slow_disconnects_total", "Clients disconnected for staying over the send queue limit",
+                 self.slow_disconnects)):
+            lines.extend((f"# HELP {name} {help}", f"# TYPE {name} counter", f"{name} {value}"))
+        for name, help, counter in (
+                ("sausage_sent_bytes_total", "Outbound bytes by message type", self.sent_bytes),
+                ("sausage_sent_messages_total", "Outbound messages by message type", self.sent_messages)):
+            lines.extend((f"# HELP {name} {help}", f"# TYPE {name} counter"))
+            lines.extend(f'{name}{{type="{action}"}} {count}' for action, count in sorted(counter.items()))
+        for name, help, read in self.gauges:
+            lines.extend((f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {read()}"))
+        return "\n".join(lines) + "\n"
+
+
+def http_response(body: str) -> bytes:
+    """HTTP answer of the metrics endpoint"""
+    content = body.encode()
+    return (b"HTTP/1.0 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            + f"Content-Length: {len(content)}\r\n\r\n".encode()
+            + content)
+
+
+def request_path(request: bytes) -> str:
+    """Path of an HTTP request, "/" if it is not one"""
+    words = request.split(b"\r\n", 1)[0].split()
+    return words[1].decode(errors="replace") if len(words) >= 2 else "/"
+
+
+def endpoint_address(address: str) -> Tuple[int, object]:
+    """Socket family and address of a metrics endpoint: "host:port" for
+    TCP, anything else for the path of a Unix socket (removed first if
+    left by a previous run)"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    if os.path.exists(address):
+        os.unlink(address)
+    return socket.AF_UNIX, address
@@ -0,0 +1,132 @@
+from typing import List, Dict, Optional, Any, Callable
+
+import os
+import signal
+from time import time, monotonic
+from collections import Counter
+
+
+PROFILE_SIGNAL = signal.SIGUSR1 # Starts a profile of a running server
+PROFILE_WINDOW = float(os.environ.get("SAUSAGE_PROFILE_WINDOW", 30.0)) # Seconds profiled by default
+MAX_PROFILE_WINDOW = 600.0
+PROFILE_DIR = os.environ.get("SAUSAGE_PROFILE_DIR", "profiles") # Where the profiles are written
+SAMPLE_INTERVAL = 0.005 # Wall-clock seconds between two samples
+MAX_DEPTH = 64 # Innermost frames kept per sample
+MAX_STACKS = 20000 # Distinct stacks kept per profile, the samples of the others are only counted
+NO_ACTION = "(loop)" # Root of the samples taken out of any action: sending, waiting
+
+
+class SamplingProfiler:
+    """Statistical profiler of the main thread, with the samples grouped by
+    the protocol action being handled.
+
+    While a profile runs, SIGALRM interrupts the main thread every
+    SAMPLE_INTERVAL seconds of wall-clock time, and its stack is counted
+    under the action set in `action` by Player.Dispatch(), or under the
+    action that scheduled the timer running (see deferred()), so the lobby
+    flushes and the other work put off to the end of the tick are still
+    charged to an action. A signal held
+    back by a long call in C is weighted by the intervals it covers, so
+    the counts follow the time spent. The cost is one stack walk per
+    sample, whatever the load, and the number of stacks kept is bounded.
+
+    At the end of the window the profile is written as collapsed stacks,
+    one "action;file:function;... count" line per stack, as read by
+    flamegraph.pl, speedscope or inferno.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, interval: float = SAMPLE_INTERVAL,
+                 on_stop: Optional[Callable[[], None]] = None) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.on_stop = on_stop # Called once a profile is written
+        self.action: Optional[str] = None # Action of the handler running, set by Player.Dispatch()
+        self.stacks = Counter() # Collapsed stack -> samples
+        self.samples = 0
+        self.dropped = 0 # Samples of stacks beyond MAX_STACKS
+        self.deadline: Optional[float] = None # While a profile runs
+        self.last_path: Optional[str] = None # Last profile written
+        self._last_sample = 0.0
+        self._names: Dict[Any, str] = {} # Code object -> "file:function"
+        self._previous_handler = None
+
+    @property
+    def running(self) -> bool:
+        return self.deadline is not None
+
+    def start(self, window: float = PROFILE_WINDOW) -> bool:
+        """Sample the main thread for `window` seconds, False if a profile is already running"""
+        if self.running:
+            return False
+        self.stacks.clear()
+        self.samples = self.dropped = 0
+        self._last_sample = monotonic()
+        self.deadline = self._last_sample + max(self.interval, min(MAX_PROFILE_WINDOW, window))
+        self._previous_handler = signal.signal(signal.SIGALRM, self._sample)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+        print(f"Profiling for {self.deadline - self._last_sample:g}s")
+        return True
+
+    def deferred(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """`callback`, run later on behalf of the action being handled now"""
+        action = self.action
+        if action is None or not self.running:
+            return callback
+        def run() -> None:
+            self.action = action
+            try:
+                callback()
+            finally:
+                self.action = None
+        return run
+
+    def stop(self) -> Optional[str]:
+        """End the profile now, and return the path of the file written"""
+        if not self.running:
+            return None
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous_handler or signal.SIG_DFL)
+        self.deadline = None
+        self.last_path = self.write()
+        by_action = Counter()
+        for stack, count in self.stacks.items():
+            by_action[stack.partition(";")[0]] += count
+        summary = ", ".join(f"{action} {count * 100 / (self.samples or 1):.0f}%"
+                            for action, count in by_action.most_common(5))
+        print(f"Profile written to {self.last_path}: {self.samples} samples ({summary})")
+        if self.on_stop is not None:
+            self.on_stop()
+        return self.last_path
+
+    def write(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"profile-{int(time())}-{os.getpid()}.collapsed")
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+            if self.dropped:
+                f.write(f"(dropped) {self.dropped}\n")
+        return path
+
+    def _sample(self, signum: int, frame: Any) -> None:
+        now = monotonic()
+        if now >= self.deadline:
+            self.stop()
+            return
+        weight = max(1, round((now - self._last_sample) / self.interval))
+        self._last_sample = now
+        self.samples += weight
+        names: List[str] = []
+        while frame is not None and len(names) < MAX_DEPTH:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                name = self._names[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            names.append(name)
+            frame = frame.f_back
+        names.append(self.action or NO_ACTION)
+        stack = ";".join(reversed(names))
+        if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+            self.stacks[stack] += weight
+        else:
+            self.dropped += weight
@@ -0,0 +1,142 @@
+from typing import List, Tuple, Dict, Optional, Iterator
+
+import atexit
+import sqlite3
+import threading
+
+from elo import GameResult
+
+
+RATINGS_PATH = "ratings.db" # Default SQLite database of the ratings
+FLUSH_INTERVAL = 1.0 # Seconds between two writes of the queued ratings
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS ratings (
+    nickname TEXT PRIMARY KEY,
+    elo INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    winner TEXT NOT NULL,
+    loser TEXT NOT NULL,
+    winner_elo INTEGER NOT NULL,
+    loser_elo INTEGER NOT NULL,
+    points INTEGER NOT NULL
+)"""
+
+
+class RatingStore:
+    """ELO of the players by nickname, kept in SQLite between connections
+    and server runs, with the log of the game results.
+
+    Lookups are primary key reads on the caller's thread, nothing is
+    loaded at startup. Ratings given to put() and results given to
+    record() are written behind by a
+    thread of the store, FLUSH_INTERVAL seconds at most after, in one
+    transaction; until then get() returns them from memory. The database
+    is in WAL mode, so the lookups never wait for these writes and the
+    nodes of a cluster can share it.
+
+    Another store only has to provide get(), put(), ratings(), record()
+    and close().
+    """
+
+    def __init__(self, path: str = RATINGS_PATH, flush_interval: float = FLUSH_INTERVAL) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self._pending: Dict[str, int] = {} # Not written yet
+        self._writing: Dict[str, int] = {} # Being written by the thread
+        self._results: List[GameResult] = [] # Not written yet
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event() # Set by put() and record()
+        self._closing = threading.Event()
+        self.writes = 0 # Transactions committed
+        self.written = 0 # Ratings written
+        self._writer = threading.Thread(target=self._write_behind, name="ratings", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def get(self, nickname: str) -> Optional[int]:
+        """ELO of a nickname, None if it never played"""
+        with self._lock:
+            elo = self._pending.get(nickname, self._writing.get(nickname))
+        if elo is not None:
+            return elo
+        row = self.db.execute("SELECT elo FROM ratings WHERE nickname = ?", (nickname,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, nickname: str, elo: int) -> None:
+        """Queue the new ELO of a nickname, without touching the database"""
+        with self._lock:
+            self._pending[nickname] = elo
+        self._wakeup.set()
+
+    def ratings(self, after: str = "", count: int = -1) -> List[Tuple[str, int]]:
+        """(nickname, ELO) of the stored players, written ones only, in
+        nickname order from the first one after `after`, `count` at most
+        (all of them if negative)"""
+        return self.db.execute(
+            "SELECT nickname, elo FROM ratings WHERE nickname > ? ORDER BY nickname LIMIT ?",
+            (after, count)
+            ).fetchall()
+
+    def record(self, result: GameResult) -> None:
+        """Queue a game result for the log"""
+        with self._lock:
+            self._results.append(result)
+        self._wakeup.set()
+
+    def history(self) -> Iterator[GameResult]:
+        """Logged game results, oldest first"""
+        rows = self.db.execute(
+            "SELECT time, winner, loser, winner_elo, loser_elo, points FROM results ORDER BY id"
+            )
+        return map(GameResult._make, rows)
+
+    def close(self) -> None:
+        """Write the queued ratings and stop the writer thread"""
+        if self._closing.is_set():
+            return
+        self._closing.set()
+        self._wakeup.set()
+        self._writer.join()
+        self.db.close()
+
+    def _write_behind(self) -> None:
+        db = sqlite3.connect(self.path) # Connections cannot be shared between threads
+        db.execute("PRAGMA synchronous=NORMAL") # Durable enough in WAL mode, and no fsync per commit
+        while True:
+            self._wakeup.wait() # Idle until something is queued
+            self._closing.wait(self.flush_interval) # Gather the others, close() cuts it short
+            self._wakeup.clear()
+            closing = self._closing.is_set() # Then the ratings queued before close() are written below
+            with self._lock:
+                self._writing, self._pending = self._pending, {}
+                results, self._results = self._results, []
+            if self._writing or results:
+                self._write(db, list(self._writing.items()), results)
+                with self._lock:
+                    self._writing = {}
+            if closing:
+                break
+        db.close()
+
+    def _write(self, db: sqlite3.Connection, ratings: List[Tuple[str, int]],
+               results: List[GameResult]) -> None:
+        with db:
+            db.executemany(
+                "INSERT INTO ratings (nickname, elo) VALUES (?, ?) "
+                "ON CONFLICT (nickname) DO UPDATE SET elo = excluded.elo",
+                ratings
+                )
+            db.executemany(
+                "INSERT INTO results (time, winner, loser, winner_elo, loser_elo, points) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                results
+                )
+        self.writes += 1
+        self.written += len(ratings)
@@ -0,0 +1,300 @@
+from typing import List, Tuple, Dict, Optional, Any, Iterator, Iterable
+from bisect import bisect_left, bisect_right, insort
+
+
+class EloIndex:
+    """Entries (player ID -> nickname, ELO) kept sorted by ELO.
+
+    The order is a sorted list of (-elo, player_id) keys, so the best ELO
+    comes first and ties are broken by ID. Lookups are dict accesses and
+    updates a bisection plus a list insertion.
+    """
+
+    def __init__(self) -> None:
+        self.entries: Dict[int, Tuple[str, int]] = {}
+        self._order: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, player_id: int) -> bool:
+        return player_id in self.entries
+
+    def get(self, player_id: int) -> Optional[Tuple[str, int]]:
+        return self.entries.get(player_id)
+
+    def set(self, player_id: int, nickname: str, elo: int) -> None:
+        """Add an entry, or move it if its ELO changed"""
+        old = self.entries.get(player_id)
+        if old is not None and old[1] != elo:
+            self._remove_key(player_id, old[1])
+        if old is None or old[1] != elo:
+            insort(self._order, (-elo, player_id))
+        self.entries[player_id] = (nickname, elo)
+
+    def remove(self, player_id: int) -> None:
+        nickname, elo = self.entries.pop(player_id)
+        self._remove_key(player_id, elo)
+
+    def _remove_key(self, player_id: int, elo: int) -> None:
+        index = bisect_left(self._order, (-elo, player_id))
+        del self._order[index]
+
+    def rank(self, player_id: int) -> int:
+        """Position of a player, starting at 0 for the best ELO"""
+        return bisect_left(self._order, (-self.entries[player_id][1], player_id))
+
+    def ranked(self, start: int = 0, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Entries from rank `start`, best ELO first, as lobby dicts"""
+        stop = None if count is None else start + count
+        return self._entries(start, stop)
+
+    def ids_between(self, elo_min: int, elo_max: int) -> List[int]:
+        """IDs of the entries whose ELO is in elo_min..elo_max"""
+        first, last = self._bounds(elo_min, elo_max)
+        return [player_id for _, player_id in self._order[first:last]]
+
+    def window(self, elo_min: int, elo_max: int, start: int = 0,
+               count: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """Page of the entries whose ELO is in elo_min..elo_max.
+
+        Returns:
+            tuple: Number of entries in the ELO range, and the `count`
+                entries from position `start` in that range as lobby dicts
+        """
+        first, last = self._bounds(elo_min, elo_max)
+        begin = min(first + start, last)
+        end = last if count is None else min(begin + count, last)
+        return last - first, self._entries(begin, end)
+
+    def page_end(self, elo_min: int, elo_max: int, start: int, count: int) -> Tuple[int, Tuple[int, float]]:
+        """Extent of a page of window(), to tell which changes reach it.
+
+        Returns:
+            tuple: Number of entries in the ELO range, and the key (-elo,
+                player_id) after the last entry of the page: an entry of
+                the range set or removed below that key moves or changes
+                the page, the ones above it only change the number of entries
+        """
+        first, last = self._bounds(elo_min, elo_max)
+        end = first + start + count
+        return last - first, self._order[end] if end < last else (-elo_min, float("inf"))
+
+    def _bounds(self, elo_min: int, elo_max: int) -> Tuple[int, int]:
+        return (bisect_left(self._order, (-elo_max,)),
+                bisect_right(self._order, (-elo_min, float("inf"))))
+
+    def _entries(self, start: int, stop: Optional[int]) -> List[Dict[str, Any]]:
+        entries = []
+        for rank, (_, player_id) in enumerate(self._order[start:stop], start + 1):
+            nickname, elo = self.entries[player_id]
+            entries.append({"id": player_id, "name": nickname, "elo": elo, "rank": rank})
+        return entries
+
+
+class PlayerRegistry:
+    """Connected players, indexed by ID and by nickname.
+
+    Nicknames are unique: a player only gets into the nickname index once
+    rename() accepted the nickname, the default "anonymous" is not indexed.
+    """
+
+    def __init__(self) -> None:
+        self.by_id: Dict[int, Any] = {}
+        self.by_nickname: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(list(self.by_id.values()))
+
+    def __contains__(self, player: Any) -> bool:
+        return self.by_id.get(player.player_id) is player
+
+    def add(self, player: Any) -> None:
+        self.by_id[player.player_id] = player
+
+    def remove(self, player: Any) -> None:
+        if player in self:
+            del self.by_id[player.player_id]
+            if self.by_nickname.get(player.nickname) is player:
+                del self.by_nickname[player.nickname]
+
+    def find(self, nickname: str) -> Optional[Any]:
+        return self.by_nickname.get(nickname)
+
+    def rename(self, player: Any, nickname: str) -> bool:
+        """Give a nickname to a player, False if another player has it"""
+        owner = self.by_nickname.get(nickname)
+        if owner is not None and owner is not player:
+            return False
+        if self.by_nickname.get(player.nickname) is player:
+            del self.by_nickname[player.nickname]
+        player.nickname = nickname
+        self.by_nickname[nickname] = player
+        return True
+
+
+BLOCK_SIZE = 512 # Keys per block of a Leaderboard, blocks are split at twice this size
+
+
+class Leaderboard:
+    """ELO of every known player by nickname, as an order-statistic list.
+    
+    The (-elo, nickname) keys are kept sorted in blocks of at most
+    2 * BLOCK_SIZE keys, with a Fenwick tree over the block lengths. The
+    rank of a key and the key at a rank are found with a bisection and a
+    walk down the tree, in O(log n); an update inserts or deletes in one
+    block, and rebuilds the tree when a block is split or emptied.
+    
+    Ranks are memoized until the next change, as the lobby pages sent
+    after a change ask for the same players over and over.
+    """
+    
+    def __init__(self, ratings: Iterable[Tuple[str, int]] = ()) -> None:
+        """Args:
+            ratings: (nickname, ELO) of the players known at startup, in any order"""
+        self.elos: Dict[str, int] = dict(ratings)
+        keys = sorted((-elo, nickname) for nickname, elo in self.elos.items())
+        self._blocks: List[List[Tuple[int, str]]] = [keys[i:i + BLOCK_SIZE]
+                                                     for i in range(0, len(keys), BLOCK_SIZE)]
+        self._maxes: List[Tuple[int, str]] = [block[-1] for block in self._blocks]
+        self._ranks: Dict[str, int] = {}
+        self._build()
+    
+    def __len__(self) -> int:
+        return len(self.elos)
+    
+    def __contains__(self, nickname: str) -> bool:
+        return nickname in self.elos
+    
+    def get(self, nickname: str) -> Optional[int]:
+        return self.elos.get(nickname)
+    
+    def set(self, nickname: str, elo: int) -> None:
+        """Add a player, or move it if its ELO changed"""
+        old = self.elos.get(nickname)
+        if old == elo:
+            return
+        if old is not None:
+            self._delete((-old, nickname))
+        self._insert((-elo, nickname))
+        self.elos[nickname] = elo
+        self._ranks.clear()
+    
+    def load(self, ratings: Iterable[Tuple[str, int]]) -> int:
+        """Add the stored ratings of players not known yet, and return how
+        many were added: the ELOs set since the server started are newer"""
+        added = 0
+        for nickname, elo in ratings:
+            if nickname not in self.elos:
+                self._insert((-elo, nickname))
+                self.elos[nickname] = elo
+                added += 1
+        if added:
+            self._ranks.clear()
+        return added
+    
+    def remove(self, nickname: str) -> None:
+        elo = self.elos.pop(nickname, None)
+        if elo is not None:
+            self._delete((-elo, nickname))
+            self._ranks.clear()
+    
+    def rank(self, nickname: str) -> int:
+        """Position of a player, starting at 0 for the best ELO"""
+        rank = self._ranks.get(nickname)
+        if rank is None:
+            key = (-self.elos[nickname], nickname)
+            block = bisect_left(self._maxes, key)
+            rank = self._ranks[nickname] = self._prefix(block) + bisect_left(self._blocks[block], key)
+        return rank
+    
+    def top(self, count: int) -> List[Dict[str, Any]]:
+        """The `count` best players, as dicts with their 1-based rank"""
+        return self.ranked(0, count)
+    
+    def around(self, rank: int, radius: int) -> List[Dict[str, Any]]:
+        """The players from `radius` ranks before `rank` to `radius` ranks after it"""
+        start = max(0, rank - radius)
+        return self.ranked(start, rank + radius + 1 - start)
+    
+    def ranked(self, start: int, count: int) -> List[Dict[str, Any]]:
+        """`count` players from rank `start` (0-based), best ELO first"""
+        entries = []
+        if start >= len(self.elos) or count <= 0:
+            return entries
+        block, index = self._locate(start)
+        rank = start + 1
+        while block < len(self._blocks) and len(entries) < count:
+            for elo, nickname in self._blocks[block][index:index + count - len(entries)]:
+                entries.append({"rank": rank, "name": nickname, "elo": -elo})
+                rank += 1
+            block, index = block + 1, 0
+        return entries
+    
+    def _insert(self, key: Tuple[int, str]) -> None:
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._build()
+            return
+        block = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+        keys = self._blocks[block]
+        insort(keys, key)
+        self._maxes[block] = keys[-1]
+        if len(keys) > 2 * BLOCK_SIZE:
+            self._blocks[block:block + 1] = [keys[:BLOCK_SIZE], keys[BLOCK_SIZE:]]
+            self._maxes[block:block + 1] = [keys[BLOCK_SIZE - 1], keys[-1]]
+            self._build()
+        else:
+            self._add(block, 1)
+    
+    def _delete(self, key: Tuple[int, str]) -> None:
+        block = bisect_left(self._maxes, key)
+        keys = self._blocks[block]
+        del keys[bisect_left(keys, key)]
+        if keys:
+            self._maxes[block] = keys[-1]
+            self._add(block, -1)
+        else:
+            del self._blocks[block]
+            del self._maxes[block]
+            self._build()
+    
+    # Fenwick tree over the block lengths, 1-based
+    
+    def _build(self) -> None:
+        tree = [0] + [len(keys) for keys in self._blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+    
+    def _add(self, block: int, delta: int) -> None:
+        i = block + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+    
+    def _prefix(self, block: int) -> int:
+        """Number of keys in the blocks before `block`"""
+        total = 0
+        while block > 0:
+            total += self._tree[block]
+            block -= block & -block
+        return total
+    
+    def _locate(self, rank: int) -> Tuple[int, int]:
+        """Block of the key at a rank, and its index in the block"""
+        block = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            i = block + step
+            if i < len(self._tree) and self._tree[i] <= rank:
+                block = i
+                rank -= self._tree[i]
+            step >>= 1
+        return block, rank
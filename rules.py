@@ -0,0 +1,269 @@
+from typing import List, Tuple, Dict, Iterable, Sequence, Optional, Any
+from itertools import combinations
+
+import os
+import json
+import hashlib
+from functools import lru_cache
+
+
+MAX_DISTANCE = 2
+
+BOARD_WIDTH = 9 # columns
+BOARD_HEIGHT = 7 # rows
+
+# Board sizes a game can be played on (columns, rows)
+BOARD_SIZES = ((9, 7), (15, 11), (21, 15))
+
+# Where the conflict matrices are cached between runs
+CACHE_DIR = os.environ.get(
+    "SAUSAGE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sausage_cache")
+    )
+# Version of the cached matrices, to bump when the crossing rules or the file layout change
+CACHE_FORMAT = 2
+
+Point = Tuple[int, int]
+Sausage = Tuple[Point, Point, Point]
+
+
+def orientation(A: Point, B: Point, C: Point) -> int:
+    """Sign of the cross product (B-A) × (C-A).
+
+    1 if the turn from point A->B->C is counter-clockwise,
+    -1 if it is clockwise, 0 if the points are collinear"""
+    cross = (B[0]-A[0])*(C[1]-A[1]) - (B[1]-A[1])*(C[0]-A[0])
+    return (cross > 0) - (cross < 0)
+
+
+def on_segment(P: Point, A: Point, B: Point) -> bool:
+    """True if P, already known collinear with A and B, lies between them"""
+    return min(A[0], B[0]) <= P[0] <= max(A[0], B[0]) and min(A[1], B[1]) <= P[1] <= max(A[1], B[1])
+
+
+def segments_intersect(p1: Point, p2: Point, p3: Point, p4: Point) -> bool:
+    """Check if two line segments intersect or touch.
+
+    Unlike a plain counter-clockwise test, the result does not depend on
+    the direction of the segments, so a sausage gives the same answer
+    whatever the order its points were clicked in."""
+    o1 = orientation(p1, p2, p3)
+    o2 = orientation(p1, p2, p4)
+    o3 = orientation(p3, p4, p1)
+    o4 = orientation(p3, p4, p2)
+
+    # p1,p2 are on opposite sides of the line p3-p4 and the other way round
+    if o1 * o2 < 0 and o3 * o4 < 0:
+        return True
+
+    # An end of one segment lies on the other one
+    return ((o1 == 0 and on_segment(p3, p1, p2)) or
+            (o2 == 0 and on_segment(p4, p1, p2)) or
+            (o3 == 0 and on_segment(p1, p3, p4)) or
+            (o4 == 0 and on_segment(p2, p3, p4)))
+
+
+def sausages_cross(sausage1: Sequence[Point], sausage2: Sequence[Point]) -> bool:
+    """Check if two sausages share a point or intersect.
+
+    Args:
+        sausage1 (list): First sausage points
+        sausage2 (list): Second sausage points
+
+    Returns:
+        bool: True or False
+    """
+    if set(sausage1) & set(sausage2):
+        return True
+
+    # Check each segment of sausage1 against each segment of sausage2
+    for i in range(3):
+        p1 = sausage1[i]
+        p2 = sausage1[(i+1)%3]
+        for j in range(3):
+            if segments_intersect(p1, p2, sausage2[j], sausage2[(j+1)%3]):
+                return True
+
+    return False
+
+
+def as_points(value: Any) -> Optional[List[Point]]:
+    """Points of a sausage sent by a client, as (x, y) tuples of ints,
+    None if it is not a list of such pairs"""
+    try:
+        points = [(x, y) for x, y in value]
+    except (TypeError, ValueError):
+        return None
+    if all(type(x) is int and type(y) is int for x, y in points):
+        return points
+    return None
+
+
+def canonical(points: Iterable[Point]) -> Sausage:
+    """Canonical form of a sausage: its three points as sorted tuples"""
+    return tuple(sorted(tuple(p) for p in points))
+
+
+class SausageTable:
+    """Every geometrically legal sausage of a board, listed once.
+
+    A sausage is legal when its 3 points are different playable nodes
+    ((x + y) even) and every pair of them is at most MAX_DISTANCE apart
+    in rows and in columns. Each legal sausage gets an integer id, its
+    index in `sausages`.
+
+    `conflicts[i]` is a bitset over the ids: bit j is set when sausages
+    i and j share a point or cross (bit i itself is always set). It is
+    built on first use and cached on disk.
+    """
+
+    def __init__(self, width: int = BOARD_WIDTH, height: int = BOARD_HEIGHT,
+                 max_distance: int = MAX_DISTANCE) -> None:
+        self.width = width
+        self.height = height
+        self.max_distance = max_distance
+        self.nodes: List[Point] = [
+            (col, row)
+            for col in range(width)
+            for row in range(height)
+            if (col + row) % 2 == 0
+        ]
+        # Only the nodes close to the first point of a trio can complete it
+        self.sausages: List[Sausage] = []
+        for first in self.nodes:
+            near = [
+                p for p in self.nodes
+                if p > first and abs(p[0] - first[0]) <= max_distance and abs(p[1] - first[1]) <= max_distance
+            ]
+            self.sausages.extend(
+                (first, second, third) for second, third in combinations(near, 2)
+                if abs(second[0] - third[0]) <= max_distance and abs(second[1] - third[1]) <= max_distance
+                )
+        self.ids: Dict[Sausage, int] = {s: i for i, s in enumerate(self.sausages)}
+        self._conflicts: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.sausages)
+
+    def sausage_id(self, points: Iterable[Point]) -> int:
+        """Id of a sausage, or -1 if it is not a legal sausage of this board"""
+        try:
+            return self.ids.get(canonical(points), -1)
+        except (TypeError, ValueError):
+            return -1
+
+    @property
+    def conflicts(self) -> List[int]:
+        """Pairwise conflict bitsets, loaded from the cache or built on first use"""
+        if self._conflicts is None:
+            self._conflicts = self._load_conflicts()
+            if self._conflicts is None:
+                self._conflicts = self._build_conflicts()
+                self._save_conflicts()
+        return self._conflicts
+
+    @property
+    def full_mask(self) -> int:
+        """Bitset of every sausage id: the moves playable on an empty board"""
+        return (1 << len(self.sausages)) - 1
+
+    def is_free(self, sausage_id: int, placed_mask: int) -> bool:
+        """True if the sausage conflicts with none of the placed ones.
+
+        Args:
+            sausage_id (int): Id of the sausage to play
+            placed_mask (int): Bitset of the ids already placed
+        """
+        return not self.conflicts[sausage_id] & placed_mask
+
+    def has_legal_move(self, placed_mask: int) -> bool:
+        """True if at least one sausage of the table can still be placed.
+
+        Args:
+            placed_mask (int): Bitset of the ids already placed
+        """
+        return any(not mask & placed_mask for mask in self.conflicts)
+
+    def play(self, remaining: int, sausage_id: int) -> int:
+        """Remaining moves once a sausage is placed.
+
+        Args:
+            remaining (int): Bitset of the sausage ids still playable
+            sausage_id (int): Id of the sausage placed
+
+        Returns:
+            int: `remaining` without the sausages conflicting with the new one
+        """
+        return remaining & ~self.conflicts[sausage_id]
+
+    @staticmethod
+    def count(remaining: int) -> int:
+        """Number of moves in a bitset of sausage ids"""
+        return bin(remaining).count("1")
+
+    def _build_conflicts(self) -> List[int]:
+        conflicts = [1 << i for i in range(len(self.sausages))]
+        boxes = [
+            (min(x for x, _ in s), max(x for x, _ in s), min(y for _, y in s), max(y for _, y in s))
+            for s in self.sausages
+        ]
+        # Sausages are sorted by their first point, so the ones that can reach
+        # sausage i are the next ones whose first column is close enough
+        for i, sausage in enumerate(self.sausages):
+            x_min, x_max, y_min, y_max = boxes[i]
+            for j in range(i + 1, len(self.sausages)):
+                bx_min, bx_max, by_min, by_max = boxes[j]
+                if bx_min > x_max:
+                    break
+                if by_min > y_max or by_max < y_min:
+                    continue
+                if sausages_cross(sausage, self.sausages[j]):
+                    conflicts[i] |= 1 << j
+                    conflicts[j] |= 1 << i
+        return conflicts
+
+    def _cache_path(self) -> str:
+        return os.path.join(
+            CACHE_DIR, f"conflicts_{self.width}x{self.height}_{self.max_distance}.json"
+            )
+
+    def _cache_key(self) -> str:
+        """Digest of the sausage list, the ids the cached bitsets refer to"""
+        return hashlib.sha256(repr(self.sausages).encode()).hexdigest()
+
+    def _load_conflicts(self) -> Optional[List[int]]:
+        try:
+            with open(self._cache_path()) as f:
+                data = json.load(f)
+            if data["format"] != CACHE_FORMAT or data["sausages"] != self._cache_key():
+                return None
+            conflicts = [int(mask, 16) for mask in data["conflicts"]]
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+        return conflicts if len(conflicts) == len(self.sausages) else None
+
+    def _save_conflicts(self) -> None:
+        data = {
+            "format": CACHE_FORMAT,
+            "sausages": self._cache_key(),
+            "conflicts": [format(mask, "x") for mask in self._conflicts]
+        }
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = self._cache_path() + f".{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._cache_path())
+        except OSError:
+            pass  # The cache is only an optimization
+
+
+@lru_cache(maxsize=None)
+def get_table(width: int = BOARD_WIDTH, height: int = BOARD_HEIGHT,
+              max_distance: int = MAX_DISTANCE) -> SausageTable:
+    """Shared table of a board size, built on first use"""
+    return SausageTable(width, height, max_distance)
+
+
+# Table of the default board, built once at import
+DEFAULT_TABLE = get_table()
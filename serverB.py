@@ -1,510 +1,254 @@
-from typing import List, Tuple, Dict, Set, Optional, Union, Any, Iterable
-from itertools import combinations
+from typing import Tuple, Dict, Optional, Any
 
+import os
 import sys
-from time import sleep
-from random import choice
+import select
+import socket
+from time import sleep, monotonic
+from functools import partial
 
 from PodSixNet.Server import Server
 from PodSixNet.Channel import Channel
+from PodSixNet.asyncwrapper import asyncore, asynchat, poll
 
+from rules import BOARD_WIDTH, BOARD_HEIGHT
+from ratings import RATINGS_PATH
+from core import Player, GameServer
+from wire import decode
+from metrics import METRICS_ENV, MAX_REQUEST_LINE, http_response, request_path, endpoint_address
+from cluster import ClusterNode, UnixBroker
 
-MAX_ELO_DIFFERENCE = 300
-HIGH_ELO_DIFFERENCE = 200
-BASE_ELO_POINTS = 100
 
-MAX_DISTANCE = 2
+LISTEN_BACKLOG = 1024 # Connections waiting to be accepted, PodSixNet only allows 5 by default
 
-BOARD_WIDTH = 9 # columns
-BOARD_HEIGHT = 7 # rows
 
-class ClientChannel(Channel):   
+class ClientChannel(Player, Channel):
     def __init__(self, *args, **kwargs):
         Channel.__init__(self, *args, **kwargs)
-        self.nickname = "anonymous"
-        self.status = "waiting" # "waiting" or "playing"
-        self.opponent = None # Nickname of the current opponent
-        self.game_id = None # Current game ID
-        self.elo = 1000 # ELO (score)
-        self.pending_invitation = None # If there is an incoming game invitation
-    
-    def Close(self):
-        """"Called when the client disconnects"""
-        self._server.DelPlayer(self)
-    
-    def Network_nickname(self, data: Dict[str, str]) -> None:
-        """"To Change player's nickname
-        
-        Args:
-            data: Dictionary containing new nickname under "nickname" key """
-            
-        self.nickname = data["nickname"]
-        self._server.UpdateLobby()
-    
-    def Network_invite(self, data: Dict[str, str]) -> None:
-        """"To check if 2 players can confront"""
-        opponent_nick = data["opponent"]
-        opponent = self._server.FindPlayer(opponent_nick)
+        self.init_player()
+        self._closed = False
+    
+    def found_terminator(self):
+        """Dispatch a message like Channel does, also accepting binary frames"""
+        data = decode(self._ibuffer)
+        self._ibuffer = b""
+        if isinstance(data, dict) and "action" in data:
+            self.Dispatch(data)
+        else:
+            print("OOB data:", data)
+    
+    def Send(self, data: Dict[str, Any]) -> int:
+        """Returns the number of bytes sent after encoding."""
+        if not self.sendqueue:
+            self._server.dirty_channels.append(self)
+        size = Channel.Send(self, data)
+        if self._server.metrics is not None:
+            self._server.metrics.sent(data["action"], size)
+        return size
+    
+    def SendEncoded(self, payload: bytes, action: str) -> int:
+        """Queue a message already encoded with encode_message(), without copying it"""
+        if not self.sendqueue:
+            self._server.dirty_channels.append(self)
+        self.sendqueue.append(payload)
+        if self._server.metrics is not None:
+            self._server.metrics.sent(action, len(payload))
+        return len(payload)
+    
+    def QueuedBytes(self) -> int:
+        """Bytes queued for this client and not accepted by its socket yet"""
+        return (sum(len(payload) for payload in self.sendqueue)
+                + sum(len(chunk) for chunk in self.producer_fifo))
+    
+    def Disconnect(self) -> None:
+        """Drop the connection of a client that does not keep up"""
+        self.sendqueue = []
+        self.producer_fifo.clear()
+        self.handle_close()
+    
+    def handle_close(self):
+        """Remove the player once: poll2 reports a hangup both with POLLHUP
+        and with the empty read that follows, each one closing the channel"""
+        if self._closed:
+            return
+        self._closed = True
+        Channel.handle_close(self)
+        self._server.channels.remove(self)
+    
+    def Pump(self):
+        """Write the messages queued during the tick as one buffer, with one send"""
+        if self.sendqueue:
+            count = len(self.sendqueue)
+            asynchat.async_chat.push(self, b"".join(self.sendqueue))
+            self.sendqueue = []
+            if self._server.metrics is not None:
+                self._server.metrics.write_sizes.observe(count)
+
+
+class ReaderChannel(asyncore.dispatcher):
+    """Calls `receive` when a file descriptor of the asyncore map is readable,
+    used for the worker pipes and the cluster broker"""
+    
+    def __init__(self, fileno: int, receive, map):
+        asyncore.dispatcher.__init__(self, map=map)
+        self.receive = receive
+        self.connected = True
+        self._fileno = fileno
+        self.add_channel(map)
+    
+    def writable(self) -> bool:
+        return False
     
-        if opponent and opponent.status == "waiting":
-            elo_diff = abs(self.elo - opponent.elo)
+    def handle_read(self) -> None:
+        if self.receive() is False:
+            self.handle_close() # The other side is gone
     
-            if elo_diff > MAX_ELO_DIFFERENCE:
-                self.Send({
-                    "action": "invite_error", 
-                    "message": f"ELO difference too large ({elo_diff} > 300)"
-                    })
-                return
-        
-            if HIGH_ELO_DIFFERENCE <= elo_diff <= MAX_ELO_DIFFERENCE and self.elo > opponent.elo:
-                # Send invitation that can be declined
-                opponent.pending_invitation = {
-                    "from": self.nickname,
-                    "from_elo": self.elo,
-                    "elo_diff": elo_diff
-                    }
-                opponent.Send({
-                    "action": "invite_request",
-                    "from": self.nickname,
-                    "from_elo": self.elo,
-                    "elo_diff": elo_diff,
-                    "forced": False  # Player can decline
-                    })
-                return
-        
-            # If ELO difference < 200 or inviting player has lower ELO, match is forced
-            opponent.pending_invitation = {
-                "from": self.nickname,
-                "from_elo": self.elo,
-                "elo_diff": elo_diff
-                }
-            opponent.Send({
-                "action": "invite_request", 
-                "from": self.nickname,
-                "from_elo": self.elo,
-                "elo_diff": elo_diff,
-                "forced": True  # Player must accept
-                })
-            
-    def Network_ovals(self, data: Dict[str, List[Tuple[int, int]]]) -> None:
-        """"To check and place a sausage
-        
-        Args:
-            data (dict): Must contain 'ovals' key with list of points"""
-            
-        if self.status == "playing" and self.opponent:
-            points = data["ovals"]
-
-            if len(points) != 3 or len(set(points)) != 3:
-                self.Send({"action": "invalid_move", 
-                           "message": "You must select exactly 3 different points"
-                           })
-                return
-
-            for x, y in points:
-                if x < 0 or x >= BOARD_WIDTH or y < 0 or y >= BOARD_HEIGHT or (x + y) % 2 != 0:
-                    self.Send({"action": "invalid_move", "message": "Invalid position on the board"})
-                    return
-            
-            if not self._server.ValidateSausage(points, self.game_id):
-                self.Send({"action": "invalid_move", "message": "Invalid sausage"})
-                return
-            
-            # Update game state
-            self._server.games[self.game_id]["sausages"].append(points)
-            
-            # Notify players
-            self.Send({"action": "valid_move", "ovals": points})
-            self.opponent.Send({"action": "ovals", "ovals": points})
-            
-            # Switch turns
-            self.Send({"action": "turn_update", "your_turn": False})
-            self.opponent.Send({"action": "turn_update", "your_turn": True})
-            
-            self._server.check_end_game(self.game_id, self)
+    def handle_close(self) -> None:
+        self.del_channel()
 
-    def Network_invite_response(self, data: Dict[str, bool]) -> None:
-        """"Response to an invitation
-        
-        Args : True or False"""
-        
-        if self.pending_invitation:
-            opponent = self._server.FindPlayer(self.pending_invitation["from"])
-            if opponent and opponent.status == "waiting":
-                if data["accept"]:
-                    self._start_game_with(opponent)
-                else:
-                    opponent.Send({
-                        "action": "invite_rejected",
-                        "message": f"{self.nickname} declined your invitation"
-                        })
-        self.pending_invitation = None
 
-           
-    def _start_game_with(self, opponent: 'ClientChannel') -> None:
-        """"To begin a new game"""
-        self.status = opponent.status = "playing"
-        self.opponent = opponent
-        opponent.opponent = self
-        self.game_id = opponent.game_id = f"{self.nickname}-{opponent.nickname}"
-        
-        self._server.games[self.game_id] = {
-            "player1": self,
-            "player2": opponent,
-            "sausages": [],
-            "initial_elos": (self.elo, opponent.elo)
-        }
-        
-        # Random choice of the first player
-        starter = choice([self, opponent])
-        self.Send({
-            "action": "start_game",
-            "opponent": opponent.nickname,
-            "opponent_elo": opponent.elo,
-            "your_turn": starter == self
-        })
-        opponent.Send({
-            "action": "start_game",
-            "opponent": self.nickname,
-            "opponent_elo": self.elo,
-            "your_turn": starter == opponent
-        })
+class BrokerChannel(ReaderChannel):
+    """Link of a cluster node to its broker, also watched for writing while
+    messages wait to be written"""
     
-    def Network_game_over(self, data: Dict[str, str]) -> None:
-        """To notify the end of the game
-        
-        Args:
-            data (dict): Must contain 'winner' key with nickname
-        """
-        if self.status == "playing" and self.opponent:
-            winner_nick = data["winner"]
-            game = self._server.games.get(self.game_id)
-            
-            if game:
-                player1, player2 = game["player1"], game["player2"]
-                elo1, elo2 = game["initial_elos"]
-                
-                if winner_nick == player1.nickname:
-                    delta = min(MAX_ELO_DIFFERENCE, elo1 - elo2)
-                    points = BASE_ELO_POINTS + delta // 3
-                    player1.elo += points
-                    player2.elo -= points
-                else:
-                    delta = min(MAX_ELO_DIFFERENCE, elo2 - elo1)
-                    points = BASE_ELO_POINTS + delta // 3
-                    player2.elo += points
-                    player1.elo -= points
-                
-                player1.Send({
-                    "action": "elo_update",
-                    "new_elo": player1.elo,
-                    "elo_change": (points if winner_nick == player1.nickname else -points)
-                })
-                player2.Send({
-                    "action": "elo_update",
-                    "new_elo": player2.elo,
-                    "elo_change": (points if winner_nick == player2.nickname else -points)
-                })
-                
-                self._server.EndGame(self.game_id, winner_nick)
+    def __init__(self, node: ClusterNode, map):
+        ReaderChannel.__init__(self, node.broker.fileno(), node.receive, map)
+        self.node = node
     
-    def Network_player_quit(self, data: Dict[str, Any]) -> None:
-        """To notify if someone quits or disconnects form the board"""
-        if self.status == "playing" and self.opponent:
-            self.opponent.Send({"action": "opponent_disconnected"})
-            self._server.EndGame(self.game_id, self.opponent.nickname)
-        
-        self.status = "waiting"
-        self.opponent = None
-        self.game_id = None
-        self._server.UpdateLobby()
-
-class MyServer(Server):
-    """Main server class handling all connections and game management."""
-    
-    channelClass = ClientChannel
+    def writable(self) -> bool:
+        return self.node.broker.pending() > 0
     
-    def __init__(self, mylocaladdr):
-        Server.__init__(self, localaddr=mylocaladdr)
-        self.players = [] # List of connected players
-        self.games = {} # Dic of the active games
-        print('Server launched')
-    
-    def Connected(self, channel: ClientChannel, addr: Tuple[str, int]) -> None:
-        """Called if a new player connects"""
-        self.AddPlayer(channel)
-    
-    def AddPlayer(self, player: ClientChannel) -> None:
-        """Add new player to the server.
-        
-        Args:
-            player (ClientChannel): The player to add
-        """
-        print(f"New Player connected: {player.nickname}")
-        self.players.append(player)
-        self.UpdateLobby()
-    
-    def DelPlayer(self, player: ClientChannel) -> None:
-        """Remove players who quits the lobby
-        
-        Args:
-            player (ClientChannel): The player to remove
-        """
-        print(f"Deleting Player {player.nickname}")
-        if player.status == "playing" and player.opponent:
-            player.opponent.Send({"action": "opponent_disconnected"})
-            self.EndGame(player.game_id, player.opponent.nickname)
-        if player in self.players:
-            self.players.remove(player)
-        self.UpdateLobby()
-    
-    def FindPlayer(self, nickname: str) -> Optional[ClientChannel]:
-        """"Find player nickname
-        
-        Args:
-            nickname (str): The nickname to search for
-            
-        Returns:
-            ClientChannel or None: The player if found, else None
-        """
-        for player in self.players:
-            if player.nickname == nickname:
-                return player
-        return None
-    
-    def UpdateLobby(self):
-        """Send updated player list to all clients"""
-        waiting_players = sorted(
-            [
-                {"name": p.nickname, "elo": p.elo} 
-                for p in self.players 
-                if p.status == "waiting"
-            ],
-            key=lambda x: x["elo"],
-            reverse=True  # Sort by ELO (highest first)
-            )
-        for p in self.players:
-            p.Send({
-                "action": "lobby_update",
-                "players": waiting_players
-            })
-    
-    def ValidateSausage(self, points: List[Tuple[int, int]], game_id: str) -> bool:
-        """Validate if sausage placement is legal.
-       
-       Args:
-           points (list): List of (x,y) tuples
-           game_id (str): The game ID
-           
-       Returns:
-           bool: True or False
-       """
-        # Number of points selected
-        if len(points) != 3 or len(set(points)) != 3:
-            return False
-        
-        # If the points are on the grid
-        for x, y in points:
-            if (not (0 <= x < BOARD_WIDTH) or 
-                not (0 <= y < BOARD_HEIGHT) or 
-                (x + y) % 2 != 0):
-                return False
+    def handle_write(self) -> None:
+        if not self.node.write():
+            self.handle_close()
+
+
+class MetricsChannel(asynchat.async_chat):
+    """One request to the metrics endpoint, see GameServer.AdminRequest()"""
     
-        # Check the distance rule (<=2 in row and <=2 in columns)
-        for i in range(3):
-            p1 = points[i]
-            connected = False
-            for j in range(3):
-                if i == j:
-                    continue
-                p2 = points[j]
-                dx = abs(p1[0] - p2[0])
-                dy = abs(p1[1] - p2[1])
-                if dx <= MAX_DISTANCE and dy <= MAX_DISTANCE:
-                    connected = True
-                    break
-            if not connected:
-                return False
-            
-        # Check sausage crossing    
-        game = self.games.get(game_id)
-        if game:
-            for sausage in game["sausages"]:
-                if self.CheckCrossing(points, sausage):
-                    return False
+    def __init__(self, sock, server: GameServer, map):
+        asynchat.async_chat.__init__(self, sock, map)
+        self.server = server
+        self._request = b""
+        self.set_terminator(b"\r\n\r\n")
     
-        return True
+    def collect_incoming_data(self, data: bytes) -> None:
+        if len(self._request) < MAX_REQUEST_LINE:
+            self._request += data
     
+    def found_terminator(self) -> None:
+        self.push(http_response(self.server.AdminRequest(request_path(self._request))))
+        self.close_when_done()
 
-    def ValidateSausageSimulated(self, points: List[Tuple[int, int]], game: Dict[str, Any]) -> bool:
-        """Validation without sending messages (for end game check)
-        
-        Args and returns : same as the previous function : ValidateSausage()"""
-        if len(points) != 3 or len(set(points)) != 3:
-            return False
-        
-        # Check distance rule
-        for i in range(3):
-            for j in range(i + 1, 3):
-                x1, y1 = points[i]
-                x2, y2 = points[j]
-                if abs(x1 - x2) > MAX_DISTANCE or abs(y1 - y2) > MAX_DISTANCE:
-                    return False
-
-        # Vérifie les croisements
-        for sausage in game["sausages"]:
-            if self.CheckCrossing(points, sausage):
-                return False
 
-        return True
+class MetricsListener(asyncore.dispatcher):
+    """Accepts the scrapes of the metrics endpoint, in the main loop"""
     
-
-    def CheckCrossing(self, sausage1: List[Tuple[int, int]], sausage2: List[Tuple[int, int]]) -> bool:
-        """Check if two sausages intersect.
-        
-        Args:
-            sausage1 (list): First sausage points
-            sausage2 (list): Second sausage points
-            
-        Returns:
-            bool: True or False
-        """
-        if set(sausage1) & set(sausage2):
-            return True
+    def __init__(self, address: str, server: GameServer, map):
+        asyncore.dispatcher.__init__(self, map=map)
+        self.server = server
+        family, addr = endpoint_address(address)
+        self.create_socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.set_reuse_addr()
+        self.bind(addr)
+        self.listen(5)
     
-        # Check each segment of sausage1 against each segment of sausage2
-        for i in range(3):
-            p1 = sausage1[i]
-            p2 = sausage1[(i+1)%3]
-        
-            for j in range(3):
-                p3 = sausage2[j]
-                p4 = sausage2[(j+1)%3]
-                
-                if self.segments_intersect(p1, p2, p3, p4):
-                    return True
-    
-        return False
+    def handle_accepted(self, sock, addr) -> None:
+        MetricsChannel(sock, self.server, self._map)
 
-    def segments_intersect(self, p1: Tuple[int, int], p2: Tuple[int, int], p3: Tuple[int, int], p4: Tuple[int, int]) -> bool:
-        """Check if two line segments intersect"""
-        # https://stackoverflow.com/questions/63398960
-        
-        def ccw(A, B, C):
-            """"Determines whether the turn from point A->B->C is counter-clockwise.
-                The result is based on the sign of the cross product (B-A) × (C-A).
-        
 
-                True if the points are in counter-clockwise order,
-                False if collinear or clockwise"""
-                
-            return (C[1]-A[1])*(B[0]-A[0]) > (B[1]-A[1])*(C[0]-A[0])
-    
-        A, B = p1, p2
-        C, D = p3, p4
-        
-        # The segments intersect if:
-        # 1. Points p1,p2 are on opposite sides of the line p3-p4 (first condition)
-        # AND
-        # 2. Points p3,p4 are on opposite sides of the line p1-p2 (second condition)
+class MyServer(GameServer, Server):
+    """Main server class handling all connections and game management."""
     
-        return ccw(A, C, D) != ccw(B, C, D) and ccw(A, B, C) != ccw(A, B, D)
+    channelClass = ClientChannel
     
-    def check_end_game(self, game_id: Dict[str, Any], last_player: ClientChannel) -> None:
-        """Check if game should end (no possible moves left).
-        
-        Args:
-            game_id (str): The game identifier
-            last_player (ClientChannel): The player who made last move
-        """
-        game = self.games.get(game_id)
-        if not game:
-            return
-        
-        # Get all occupied points
-        occupied = set()
-        for sausage in game["sausages"]:
-            occupied.update(sausage)
-
-        # Get all valid remaining points
-        valid_points = [
-            (col, row)
-            for col in range(BOARD_WIDTH)
-            for row in range(BOARD_HEIGHT)
-            if (col + row) % 2 == 0 and (col, row) not in occupied
-        ]
-        
-        # Check if any valid sausage can still be placed
-        for trio in combinations(valid_points, 3):
-            if self.ValidateSausageSimulated(list(trio), game):
-                return  # At least one valid move remains
-        
-        # No valid moves left - end game
-        self.EndGame(str(game_id), winner=last_player.nickname)
+    def __init__(self, mylocaladdr, board_size: Tuple[int, int] = (BOARD_WIDTH, BOARD_HEIGHT),
+                 shards: int = 0, ratings: Optional[str] = RATINGS_PATH):
+        self.dirty_channels = [] # Channels that queued messages during this tick, see Flush()
+        Server.__init__(self, localaddr=mylocaladdr, listeners=LISTEN_BACKLOG)
+        self.init_server(board_size, shards, ratings)
+        if self.shards:
+            for connection in self.shards.connections:
+                ReaderChannel(connection.fileno(), partial(self.shards.receive, connection), self._map)
+        print('Server launched')
     
-    def EndGame(self, game_id: str, winner: str) -> None:
-        """Clean up after game ends and update ELOs.
+    def JoinCluster(self, broker_path: str) -> None:
+        """Share the lobby with the other nodes connected to a cluster broker"""
+        node = ClusterNode(self, UnixBroker(broker_path))
+        BrokerChannel(node, self._map)
+        print(f"Cluster node {node.node}")
+    
+    def ServeMetrics(self, address: str) -> None:
+        """Keep metrics, and serve them in the Prometheus text format over
+        HTTP at "host:port" or at the path of a Unix socket"""
+        self.EnableMetrics()
+        MetricsListener(address, self, self._map)
+        print(f"Metrics served at {address}")
+    
+    def Wait(self) -> None:
+        """Block until a socket is ready or the next timer expires, and handle the socket events"""
+        timeout = max(0.0, self.timers[0][0] - monotonic()) if self.timers else None
+        if hasattr(select, "poll"):
+            asyncore.poll2(timeout, self._map)
+        else:
+            asyncore.poll(timeout, self._map)
+    
+    def Flush(self) -> None:
+        """End of tick: write what the channels queued, only visiting the ones that did"""
+        dirty, self.dirty_channels = self.dirty_channels, []
+        for channel in dirty:
+            if not channel._closed:
+                channel.Pump()
+    
+    def Launch(self, blocking: bool = True):
+        """Main loop.
+        
+        A tick handles the ready sockets, then the due timers, then sends
+        everything the tick produced with one write per channel.
         
         Args:
-            game_id (str): The game identifier
-            winner (str): Nickname of the winning player
+            blocking (bool): Wait for the network or a timer instead of
+                polling every millisecond
         """
-        if game_id in self.games:
-            game = self.games[game_id]
-            player1 = game["player1"]
-            player2 = game["player2"]
-            nickname1 = player1.nickname
-            nickname2 = player2.nickname
-            elo1, elo2 = game["initial_elos"]
-
-            # Calculate ELO changes
-            if winner == nickname1:
-                delta = min(MAX_ELO_DIFFERENCE, elo1 - elo2)
-                points = BASE_ELO_POINTS + delta // 3
-                player1.elo += points
-                player2.elo -= points
-            else:
-                delta = min(MAX_ELO_DIFFERENCE, elo2 - elo1)
-                points = BASE_ELO_POINTS + delta // 3
-                player2.elo += points
-                player1.elo -= points
-
-            # Send ELO updates
-            player1.Send({
-                "action": "elo_update",
-                "new_elo": player1.elo,
-                "elo_change": (points if winner == nickname1 else -points)
-                })
-            player2.Send({
-                "action": "elo_update",
-                "new_elo": player2.elo,
-                "elo_change": (points if winner == nickname2 else -points)
-                })
-
-            # Announce winner
-            player1.Send({"action": "game_over", "winner": winner})
-            player2.Send({"action": "game_over", "winner": winner})
-
-            # Reset player states
-            player1.status = "waiting"
-            player2.status = "waiting"
-            player1.opponent = None
-            player2.opponent = None
-            del self.games[game_id]
-
-            self.UpdateLobby()
-    
-    def Launch(self):
+        self.LoadLeaderboard()
         while True:
-            self.Pump()
-            sleep(0.001)
+            if blocking:
+                self.Wait()
+                if self.metrics is not None:
+                    self.metrics.begin_tick()
+                self.RunTimers()
+                self.Flush()
+            else:
+                sleep(0.001)
+                if self.metrics is not None:
+                    self.metrics.begin_tick()
+                self.RunTimers()
+                self.Flush()
+                poll(map=self._map)
+            if self.metrics is not None:
+                self.metrics.end_tick()
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Please use: python3", sys.argv[0], "host:port")
-        print("e.g., python3", sys.argv[0], "localhost:31425")
+    board_size = (BOARD_WIDTH, BOARD_HEIGHT)
+    shards = 0
+    broker_path = None
+    if len(sys.argv) not in (2, 3, 4, 5):
+        print("Please use: python3", sys.argv[0], "host:port [columnsxrows [workers [broker_socket]]]")
+        print("e.g., python3", sys.argv[0], "localhost:31425 15x11 4 /tmp/sausage.sock")
         host, port = "localhost", "31425"
     else:
         host, port = sys.argv[1].split(":")
-    s = MyServer((host, int(port)))
+        if len(sys.argv) >= 3:
+            board_size = tuple(int(n) for n in sys.argv[2].split("x"))
+        if len(sys.argv) >= 4:
+            shards = int(sys.argv[3])
+        if len(sys.argv) == 5:
+            broker_path = sys.argv[4]
+    s = MyServer((host, int(port)), board_size, shards)
+    if broker_path:
+        s.JoinCluster(broker_path)
+    if os.environ.get(METRICS_ENV):
+        s.ServeMetrics(os.environ[METRICS_ENV])
+    s.ProfileOnSignal()
     s.Launch()
\ No newline at end of file
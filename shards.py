@@ -0,0 +1,201 @@
+from typing import List, Tuple, Dict, Optional, Any, Callable
+from collections import namedtuple
+from itertools import count
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+
+from rules import get_table
+from game import Game
+
+
+# Stand-in for a player inside a worker, which only needs the ELO
+Seat = namedtuple("Seat", ("slot", "elo"))
+
+
+class RemoteGame:
+    """Front-end record of a game played by a worker process.
+
+    The worker owns the board; the front-end only keeps what the lobby
+    needs: the players, their ELO at the start and where the game runs.
+    """
+
+    __slots__ = ("game_id", "key", "shard", "player1", "player2", "initial_elos",
+                 "columns", "rows")
+
+    def __init__(self, game_id: int, key: int, shard: int, player1: Any, player2: Any,
+                 columns: int, rows: int) -> None:
+        self.game_id = game_id
+        self.key = key # Unique for the server run, unlike game IDs which are reused
+        self.shard = shard
+        self.player1 = player1
+        self.player2 = player2
+        self.initial_elos = (player1.elo, player2.elo)
+        self.columns = columns
+        self.rows = rows
+
+    @property
+    def table(self) -> Any:
+        """Sausage ids of the board, shared with the worker through get_table()"""
+        return get_table(self.columns, self.rows)
+
+
+def move_error(game: Game, points: List[Tuple[int, int]]) -> Optional[str]:
+    """Why a sausage cannot be placed in a game, None if it can"""
+    if len(points) != 3 or len(set(points)) != 3:
+        return "You must select exactly 3 different points"
+    table = game.table
+    for x, y in points:
+        if x < 0 or x >= table.width or y < 0 or y >= table.height or (x + y) % 2 != 0:
+            return "Invalid position on the board"
+    if not game.is_legal(table.sausage_id(points)):
+        return "Invalid sausage"
+    return None
+
+
+def run_worker(connection: Connection, elo_points: Callable[[int, int], int]) -> None:
+    """Main loop of a worker process: play the moves of its games.
+
+    Messages received:
+        ("start", key, columns, rows, (elo1, elo2))
+        ("play", key, slot, points)
+        ("drop", key)
+    Replies to "play":
+        ("played", key, slot, points, error, remaining moves, ELO points)
+        where the ELO points are won by `slot` and only set when the move
+        ended the game.
+    """
+    games: Dict[int, Game] = {}
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return # The front-end is gone
+        try:
+            reply = handle_message(games, message, elo_points)
+        except Exception as error: # A bad message must not end the other games
+            print(f"Worker failed on {message[0]!r}: {error!r}")
+            if message[0] != "play":
+                continue
+            _, key, slot, points = message
+            game = games.get(key)
+            reply = ("played", key, slot, points, "Invalid sausage",
+                     game.remaining_moves if game is not None else 0, None)
+        if reply is not None:
+            connection.send(reply)
+
+
+def handle_message(games: Dict[int, Game], message: Tuple[Any, ...],
+                   elo_points: Callable[[int, int], int]) -> Optional[Tuple[Any, ...]]:
+    """Apply a message of the front-end to the games of a worker, and
+    return the reply to send, if any"""
+    kind, key = message[0], message[1]
+    if kind == "start":
+        _, _, columns, rows, (elo1, elo2) = message
+        games[key] = Game(key, Seat(1, elo1), Seat(2, elo2), get_table(columns, rows))
+    elif kind == "play":
+        _, _, slot, points = message
+        game = games.get(key)
+        if game is None:
+            return None # Dropped by the front-end meanwhile
+        error = move_error(game, points)
+        points_won = None
+        if error is None:
+            game.play(game.table.sausage_id(points))
+            if not game.remaining:
+                # The player who placed the last sausage wins
+                winner_elo, loser_elo = game.initial_elos if slot == 1 else game.initial_elos[::-1]
+                points_won = elo_points(winner_elo, loser_elo)
+                del games[key]
+        return ("played", key, slot, points, error, game.remaining_moves, points_won)
+    elif kind == "drop":
+        games.pop(key, None)
+    return None
+
+
+class ShardPool:
+    """Worker processes that own the games, and the pipes to reach them.
+
+    Each game goes to the least loaded worker. The transport watches
+    `connections` and calls receive() when one is readable; every reply
+    is passed to `on_result`. When the pipe of a worker breaks, the
+    worker is left out from then on and `on_lost` gets its number, to
+    end its games.
+    """
+
+    def __init__(self, workers: int, on_result: Callable[[Tuple[Any, ...]], None],
+                 elo_points: Callable[[int, int], int], on_lost: Callable[[int], None]) -> None:
+        self.on_result = on_result
+        self.on_lost = on_lost
+        self.connections: List[Connection] = []
+        self.processes: List[BaseProcess] = []
+        self.load: List[int] = [] # Games per worker
+        self.alive: List[bool] = []
+        self._keys = count()
+        # Spawned workers only inherit their own pipe, so each one sees
+        # the end of the front-end when its pipe closes
+        context = get_context("spawn")
+        for _ in range(workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=run_worker, args=(child, elo_points), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+            self.load.append(0)
+            self.alive.append(True)
+
+    def start(self, game_id: int, player1: Any, player2: Any, columns: int, rows: int) -> Optional[RemoteGame]:
+        """Give a new game to a worker, None if no worker is left"""
+        while any(self.alive):
+            shard = min((shard for shard in range(len(self.load)) if self.alive[shard]),
+                        key=self.load.__getitem__)
+            game = RemoteGame(game_id, next(self._keys), shard, player1, player2, columns, rows)
+            if self._send(shard, ("start", game.key, columns, rows, game.initial_elos)):
+                self.load[shard] += 1
+                return game
+        return None
+
+    def play(self, game: RemoteGame, player: Any, points: List[Tuple[int, int]]) -> None:
+        slot = 1 if player is game.player1 else 2
+        self._send(game.shard, ("play", game.key, slot, points))
+
+    def drop(self, game: RemoteGame) -> None:
+        """Forget a finished game, the worker may have done it already"""
+        self.load[game.shard] -= 1
+        self._send(game.shard, ("drop", game.key))
+
+    def receive(self, connection: Connection) -> bool:
+        """Handle the replies waiting on a worker pipe, False once it is broken"""
+        shard = self.connections.index(connection)
+        while self.alive[shard]:
+            try:
+                if not connection.poll():
+                    break
+                message = connection.recv()
+            except (EOFError, OSError):
+                self._lost(shard)
+                break
+            self.on_result(message)
+        return self.alive[shard]
+
+    def _send(self, shard: int, message: Tuple[Any, ...]) -> bool:
+        if not self.alive[shard]:
+            return False
+        try:
+            self.connections[shard].send(message)
+        except OSError: # BrokenPipeError, ConnectionResetError...
+            self._lost(shard)
+            return False
+        return True
+
+    def _lost(self, shard: int) -> None:
+        if self.alive[shard]:
+            self.alive[shard] = False
+            self.on_lost(shard)
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.close()
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,182 @@
+from typing import List, Tuple, Dict, Any, Callable
+from struct import Struct, error as StructError
+
+# rencode does not depend on asyncore, so it can be used on any Python version
+from PodSixNet.rencode import dumps, loads
+
+
+TERMINATOR = b"\0---\0" # End of each message, as in PodSixNet
+
+# Binary frames start with their kind. A message encoded by rencode never
+# starts with these bytes, they are small integers and messages are dicts.
+MOVE = 1 # Server -> client: a sausage was placed, and whose turn it is
+PLAY = 2 # Client -> server: place a sausage
+LOBBY_UPDATE = 3
+LOBBY_DELTA = 4
+LOBBY_PAGE = 5
+
+OWN_MOVE = 1 # MOVE flags
+YOUR_TURN = 2
+
+MOVE_FRAME = Struct("<BHHB") # kind, sausage id, remaining moves, flags
+PLAY_FRAME = Struct("<BH") # kind, sausage id
+UPDATE_HEADER = Struct("<BIH") # kind, version, entries
+DELTA_HEADER = Struct("<BIHHH") # kind, version, joined, updated, left
+PAGE_HEADER = Struct("<BIiiHHIHH") # kind, version, elo_min, elo_max, page, pages, total, players, podium
+ENTRY = Struct("<QiIB") # ID, ELO, rank (0 if none), nickname length, then the UTF-8 nickname
+PLAYER_ID = Struct("<Q")
+
+
+def encode_message(data: Dict[str, Any]) -> bytes:
+    """Encode a message once, to be passed to SendEncoded() of many players"""
+    return dumps(data) + TERMINATOR
+
+
+def encode(data: Dict[str, Any], binary: bool) -> bytes:
+    """Encode a message as a binary frame if the client negotiated them and
+    the message has one, else as a rencode dict"""
+    if binary and data["action"] in _ENCODERS:
+        try:
+            frame = _ENCODERS[data["action"]](data)
+        except (StructError, ValueError):
+            pass # Out of the frame ranges
+        else:
+            if _is_safe(frame):
+                return frame + TERMINATOR
+    return encode_message(data)
+
+
+def move_frame(sausage_id: int, remaining_moves: int, own_move: bool) -> bytes:
+    """A placed sausage and the turn change, for one of the two players.
+
+    Ids and move counts are below 1271, so their high byte is at most 4 and
+    the frame cannot contain a terminator."""
+    flags = OWN_MOVE if own_move else YOUR_TURN
+    return MOVE_FRAME.pack(MOVE, sausage_id, remaining_moves, flags) + TERMINATOR
+
+
+def play_frame(sausage_id: int) -> bytes:
+    return PLAY_FRAME.pack(PLAY, sausage_id) + TERMINATOR
+
+
+def decode(frame: bytes) -> Any:
+    """Decode a frame received without its terminator, binary or rencode.
+
+    Binary frames are turned into the dict their handlers expect."""
+    if frame and frame[0] in _DECODERS:
+        return _DECODERS[frame[0]](frame)
+    return loads(frame)
+
+
+def _is_safe(frame: bytes) -> bool:
+    """False if the packed bytes could be mistaken for a terminator"""
+    return (frame + TERMINATOR).find(TERMINATOR) == len(frame)
+
+
+def _pack_entries(entries: List[Dict[str, Any]]) -> bytes:
+    parts = []
+    for entry in entries:
+        name = entry["name"].encode("utf8")
+        parts.append(ENTRY.pack(entry["id"], entry["elo"], entry.get("rank", 0), len(name)))
+        parts.append(name)
+    return b"".join(parts)
+
+
+def _unpack_entries(frame: bytes, offset: int, count: int) -> Tuple[List[Dict[str, Any]], int]:
+    entries = []
+    for _ in range(count):
+        player_id, elo, rank, length = ENTRY.unpack_from(frame, offset)
+        offset += ENTRY.size
+        entry = {"id": player_id, "name": frame[offset:offset + length].decode("utf8"), "elo": elo}
+        if rank:
+            entry["rank"] = rank
+        entries.append(entry)
+        offset += length
+    return entries, offset
+
+
+def _encode_update(data: Dict[str, Any]) -> bytes:
+    players = data["players"]
+    return UPDATE_HEADER.pack(LOBBY_UPDATE, data["version"], len(players)) + _pack_entries(players)
+
+
+def _encode_delta(data: Dict[str, Any]) -> bytes:
+    join, update, leave = data["join"], data["update"], data["leave"]
+    return b"".join((
+        DELTA_HEADER.pack(LOBBY_DELTA, data["version"], len(join), len(update), len(leave)),
+        _pack_entries(join),
+        _pack_entries(update),
+        b"".join(PLAYER_ID.pack(player_id) for player_id in leave)
+        ))
+
+
+def _encode_page(data: Dict[str, Any]) -> bytes:
+    players, podium = data["players"], data["podium"]
+    return b"".join((
+        PAGE_HEADER.pack(LOBBY_PAGE, data["version"], data["elo_min"], data["elo_max"],
+                         data["page"], data["pages"], data["total"], len(players), len(podium)),
+        _pack_entries(players),
+        _pack_entries(podium)
+        ))
+
+
+def _decode_move(frame: bytes) -> Dict[str, Any]:
+    _, sausage_id, remaining_moves, flags = MOVE_FRAME.unpack(frame)
+    return {
+        "action": "move",
+        "sausage": sausage_id,
+        "remaining_moves": remaining_moves,
+        "own_move": bool(flags & OWN_MOVE),
+        "your_turn": bool(flags & YOUR_TURN)
+        }
+
+
+def _decode_play(frame: bytes) -> Dict[str, Any]:
+    _, sausage_id = PLAY_FRAME.unpack(frame)
+    return {"action": "ovals", "sausage": sausage_id}
+
+
+def _decode_update(frame: bytes) -> Dict[str, Any]:
+    _, version, count = UPDATE_HEADER.unpack_from(frame)
+    players, _ = _unpack_entries(frame, UPDATE_HEADER.size, count)
+    return {"action": "lobby_update", "version": version, "players": players}
+
+
+def _decode_delta(frame: bytes) -> Dict[str, Any]:
+    _, version, joined, updated, left = DELTA_HEADER.unpack_from(frame)
+    join, offset = _unpack_entries(frame, DELTA_HEADER.size, joined)
+    update, offset = _unpack_entries(frame, offset, updated)
+    leave = [PLAYER_ID.unpack_from(frame, offset + i * PLAYER_ID.size)[0] for i in range(left)]
+    return {"action": "lobby_delta", "version": version, "join": join, "update": update, "leave": leave}
+
+
+def _decode_page(frame: bytes) -> Dict[str, Any]:
+    _, version, elo_min, elo_max, page, pages, total, count, podium_count = PAGE_HEADER.unpack_from(frame)
+    players, offset = _unpack_entries(frame, PAGE_HEADER.size, count)
+    podium, _ = _unpack_entries(frame, offset, podium_count)
+    return {
+        "action": "lobby_page",
+        "version": version,
+        "elo_min": elo_min,
+        "elo_max": elo_max,
+        "page": page,
+        "pages": pages,
+        "total": total,
+        "players": players,
+        "podium": podium
+        }
+
+
+_ENCODERS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {
+    "lobby_update": _encode_update,
+    "lobby_delta": _encode_delta,
+    "lobby_page": _encode_page
+    }
+
+_DECODERS: Dict[int, Callable[[bytes], Dict[str, Any]]] = {
+    MOVE: _decode_move,
+    PLAY: _decode_play,
+    LOBBY_UPDATE: _decode_update,
+    LOBBY_DELTA: _decode_delta,
+    LOBBY_PAGE: _decode_page
+    }